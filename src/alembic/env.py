@@ -13,11 +13,12 @@ if config.config_file_name is not None:
 
 
 target_metadata = Base.metadata
-config.set_main_option("sqlalchemy.url", Config.DB_URL_SYNC)
+# The app passes the database it runs against (see database/migrations.py);
+# the alembic CLI migrates the one from the environment.
+url = config.attributes.get("url", Config.DB_URL_SYNC)
 
 
 def run_migrations_offline() -> None:
-    url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
@@ -36,6 +37,7 @@ def run_migrations_online() -> None:
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        url=url,
     )
 
     with connectable.connect() as connection:
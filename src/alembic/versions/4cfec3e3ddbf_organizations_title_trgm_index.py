@@ -0,0 +1,33 @@
+"""organizations title trigram index
+
+Revision ID: 4cfec3e3ddbf
+Revises: 7677b95ab996
+Create Date: 2026-10-17 12:26:05.771942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4cfec3e3ddbf"
+down_revision: Union[str, None] = "7677b95ab996"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # trigram extraction of Cyrillic relies on a UTF-8 database with a non-C
+    # LC_CTYPE (the postgis image defaults to en_US.utf8)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_organizations_title_trgm",
+        "organizations",
+        ["title"],
+        postgresql_using="gin",
+        postgresql_ops={"title": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_organizations_title_trgm", table_name="organizations")
@@ -0,0 +1,46 @@
+"""buildings geog column
+
+Revision ID: 7677b95ab996
+Revises: dc2417adce67
+Create Date: 2026-10-17 11:03:19.184630
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from geoalchemy2 import Geography
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7677b95ab996"
+down_revision: Union[str, None] = "dc2417adce67"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    # stored generated column: existing rows are backfilled by the table rewrite
+    op.add_column(
+        "buildings",
+        sa.Column(
+            "geog",
+            Geography(geometry_type="POINT", srid=4326, spatial_index=False),
+            sa.Computed(
+                "ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography",
+                persisted=True,
+            ),
+        ),
+    )
+    op.create_index(
+        "ix_buildings_geog",
+        "buildings",
+        ["geog"],
+        postgresql_using="gist",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_buildings_geog", table_name="buildings")
+    op.drop_column("buildings", "geog")
@@ -0,0 +1,27 @@
+"""activities unique path
+
+Revision ID: a9b612316d54
+Revises: dd452eeb715e
+Create Date: 2026-10-17 15:12:37.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a9b612316d54"
+down_revision: Union[str, None] = "dd452eeb715e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_activity inserts with ON CONFLICT (path) DO NOTHING
+    op.drop_index("ix_activities_path", table_name="activities", if_exists=True)
+    op.create_index("ix_activities_path", "activities", ["path"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_activities_path", table_name="activities")
+    op.create_index("ix_activities_path", "activities", ["path"])
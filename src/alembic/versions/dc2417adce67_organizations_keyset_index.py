@@ -0,0 +1,30 @@
+"""organizations keyset index
+
+Revision ID: dc2417adce67
+Revises:
+Create Date: 2026-10-17 10:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "dc2417adce67"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS ltree")
+    op.create_index(
+        "ix_organizations_b_id_id",
+        "organizations",
+        ["b_id", "id"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_organizations_b_id_id", table_name="organizations")
@@ -0,0 +1,33 @@
+"""activity lookup indexes
+
+Revision ID: dd452eeb715e
+Revises: 4cfec3e3ddbf
+Create Date: 2026-10-17 13:40:52.016377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "dd452eeb715e"
+down_revision: Union[str, None] = "4cfec3e3ddbf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_activities_label", "activities", ["label"])
+    op.create_index(
+        "ix_activities_path_gist",
+        "activities",
+        ["path"],
+        postgresql_using="gist",
+    )
+    op.create_index("ix_rel_ao_act_id", "rel_ao", ["act_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_rel_ao_act_id", table_name="rel_ao")
+    op.drop_index("ix_activities_path_gist", table_name="activities")
+    op.drop_index("ix_activities_label", table_name="activities")
@@ -1,19 +1,22 @@
-from typing import Any
+from typing import List
 
-import jwt
-from fastapi import APIRouter, Depends, Request, Security
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.exceptions import HTTPException
-from fastapi.security import APIKeyHeader
+from fastapi.responses import JSONResponse
 from loguru import logger
 
-from config import Config
+from api.auth import check_key, revoke_token
+from api.bulk import bulk_load, openapi_body
+from api.responses import list_response, model_response
 from database.dao import Database
 from database.models import (
+    ActivitiesIn,
     ActivityIn,
     ActivityOut,
     BuildingIn,
     BuildingOut,
     BuildingUpdate,
+    BulkResult,
     OrganizationIn,
     OrganizationOut,
     OrganizationUpdate,
@@ -21,27 +24,6 @@ from database.models import (
 
 router = APIRouter()
 
-# auth placeholder -------
-API_KEY_NAME = "X-API-KEY"
-api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
-
-SECRET = Config.SECRET
-ALGO = "HS256"
-
-
-def check_key(api_key: str = Security(api_key_header)) -> str:
-    try:
-        data = jwt.decode(api_key, SECRET, algorithms=[ALGO])
-    except jwt.PyJWTError:
-        raise HTTPException(401, "Неверный API-ключ") from jwt.PyJWTError
-    if data.get("scope") != "api-access":
-        raise HTTPException(401, "Неверный API-ключ")
-    return api_key
-
-
-# auth placeholder -------
-
-
 """
 POST REQUESTS
 """
@@ -58,15 +40,12 @@ POST REQUESTS
 async def create_organization_h(
     req: Request,
     org_mod: OrganizationIn,
-) -> dict[str, Any] | HTTPException:
+) -> Response:
     try:
         result = await Database.create_organization(org_mod)
 
         if result:
-            result = OrganizationOut.model_validate(result).model_dump(
-                exclude_none=True,
-            )
-            return result
+            return model_response(OrganizationOut, result)
     except Exception as e:
         raise HTTPException(400, e.__class__.__name__) from e
 
@@ -84,13 +63,12 @@ async def create_organization_h(
 async def create_building_h(
     req: Request,
     build_mod: BuildingIn,
-) -> dict[str, Any] | HTTPException:
+) -> Response:
     try:
         result = await Database.create_building(build_mod)
 
         if result:
-            result = BuildingOut.model_validate(result).model_dump(exclude_none=True)
-            return result
+            return model_response(BuildingOut, result)
     except Exception as e:
         raise HTTPException(400, e.__class__.__name__) from e
 
@@ -106,13 +84,12 @@ async def create_building_h(
 async def create_activity_h(
     req: Request,
     act_mod: ActivityIn,
-):
+) -> Response:
     try:
         result = await Database.create_activity(act_mod)
 
         if result:
-            result = ActivityOut.model_validate(result).model_dump(exclude_none=True)
-            return result
+            return model_response(ActivityOut, result)
 
     except Exception as e:
         raise HTTPException(400, e.__class__.__name__) from e
@@ -120,6 +97,67 @@ async def create_activity_h(
     raise HTTPException(500, "ISE")
 
 
+@router.post(
+    "/api/organizations/bulk",
+    summary="Массовое создание организаций (JSON-массив или NDJSON)",
+    response_model=BulkResult,
+    status_code=200,
+    tags=["POST Запросы"],
+    dependencies=[Depends(check_key)],
+    openapi_extra=openapi_body,
+)
+async def bulk_create_organizations_h(req: Request) -> Response:
+    result = await bulk_load(req, OrganizationIn, Database.bulk_create_organizations)
+    return model_response(BulkResult, result)
+
+
+@router.post(
+    "/api/buildings/bulk",
+    summary="Массовое создание зданий (JSON-массив или NDJSON)",
+    response_model=BulkResult,
+    status_code=200,
+    tags=["POST Запросы"],
+    dependencies=[Depends(check_key)],
+    openapi_extra=openapi_body,
+)
+async def bulk_create_buildings_h(req: Request) -> Response:
+    result = await bulk_load(req, BuildingIn, Database.bulk_create_buildings)
+    return model_response(BulkResult, result)
+
+
+@router.post(
+    "/api/activities/create",
+    summary="Создать несколько деятельностей",
+    response_model=List[ActivityOut],
+    status_code=200,
+    tags=["POST Запросы"],
+    dependencies=[Depends(check_key)],
+)
+async def create_activities_h(
+    req: Request,
+    acts_mod: ActivitiesIn,
+) -> Response:
+    try:
+        result = await Database.create_activities(acts_mod.chains)
+    except Exception as e:
+        raise HTTPException(400, e.__class__.__name__) from e
+
+    return list_response(ActivityOut, result)
+
+
+@router.post(
+    "/api/token/revoke",
+    summary="Отозвать текущий токен",
+    tags=["Аутентификация"],
+)
+async def revoke_token_h(
+    _req: Request,
+    api_key: str = Depends(check_key),
+) -> JSONResponse:
+    await revoke_token(api_key)
+    return JSONResponse({"status": "ok"})
+
+
 """
 PUT REQUESTS
 """
@@ -136,15 +174,12 @@ PUT REQUESTS
 async def update_organization_h(
     req: Request,
     org_mod: OrganizationUpdate,
-) -> dict[str, Any] | HTTPException:
+) -> Response:
     try:
         result = await Database.update_organization(org_mod)
 
         if result:
-            result = OrganizationOut.model_validate(result).model_dump(
-                exclude_none=True,
-            )
-            return result
+            return model_response(OrganizationOut, result)
 
     except Exception as e:
         raise HTTPException(400, e.__class__.__name__) from e
@@ -163,13 +198,12 @@ async def update_organization_h(
 async def update_building_h(
     req: Request,
     build_mod: BuildingUpdate,
-) -> dict[str, Any] | HTTPException:
+) -> Response:
     try:
         result = await Database.update_building(build_mod)
 
         if result:
-            result = BuildingOut.model_validate(result).model_dump(exclude_none=True)
-            return result
+            return model_response(BuildingOut, result)
 
     except Exception as e:
         raise HTTPException(400, e.__class__.__name__) from e
@@ -1,42 +1,79 @@
-from datetime import datetime as dt
-from typing import List
-
-import jwt
-from fastapi import APIRouter, Depends, Query, Request, Security
-from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.security import APIKeyHeader
-
+import json
+from typing import Annotated, List, Literal
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.auth import check_key, issue_token
+from api.export import MEDIA_TYPES, export_body
+from api.responses import (
+    ModelResponse,
+    json_list_response,
+    list_response,
+    model_response,
+    sparse_model,
+)
 from config import Config
 from database.dao import Database
 from database.models import (
+    ActivityNodeOut,
     BuildingDelete,
+    BuildingNearOut,
     BuildingOut,
     OrganizationDelete,
+    OrganizationNearOut,
     OrganizationOut,
 )
+from utils.fieldsets import Fieldset, parse_fieldset
+from utils.geo import GeoPoint
+from utils.pagination import CURSOR_HEADER, PageParams
+from utils.query_stats import query_budget
 
 router = APIRouter()
 
-# auth placeholder -------
-API_KEY_NAME = "X-API-KEY"
-api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
-SECRET = Config.SECRET
-ALGO = "HS256"
+def org_fieldset(
+    fields: str | None = Query(
+        None,
+        description=(
+            "Поля организации через запятую: id, title, phone (по умолчанию все)"
+        ),
+    ),
+    expand: str | None = Query(
+        None,
+        description=(
+            "Связи через запятую: building, activities (по умолчанию обе);"
+            " пустое значение — без связей, они не запрашиваются из БД"
+        ),
+    ),
+) -> Fieldset:
+    return parse_fieldset(fields, expand)
 
 
-def check_key(api_key: str = Security(api_key_header)):
-    try:
-        data = jwt.decode(api_key, SECRET, algorithms=[ALGO])
-    except jwt.PyJWTError:
-        raise HTTPException(401, "Неверный API-ключ") from jwt.PyJWTError
-    if data.get("scope") != "api-access":
-        raise HTTPException(401, "Неверный API-ключ")
-    return api_key
+OrgFieldset = Annotated[Fieldset, Depends(org_fieldset)]
+
+
+def page_params(
+    limit: int = Query(50, ge=1, le=500, description="Размер страницы"),
+    after: str | None = Query(
+        None,
+        description=f"Курсор следующей страницы (заголовок {CURSOR_HEADER})",
+    ),
+) -> PageParams:
+    return PageParams(limit, after)
+
+
+Paging = Annotated[PageParams, Depends(page_params)]
+
+
+def point_params(
+    lat: float = Query(..., description="Широта точки"),
+    lon: float = Query(..., description="Долгота точки"),
+) -> GeoPoint:
+    return GeoPoint(lat, lon)
 
 
-# auth placeholder -------
+Point = Annotated[GeoPoint, Depends(point_params)]
 
 """
 GET REQUESTS
@@ -45,15 +82,8 @@ GET REQUESTS
 
 @router.get("/api/token", tags=["Аутентификация"], summary="Получить токен")
 async def get_token(_req: Request):
-    token = jwt.encode(
-        {
-            "encode-time": dt.utcnow().strftime("%d %b %Y, %H:%M:%S"),
-            "scope": "api-access",
-        },
-        SECRET,
-        algorithm=ALGO,
-    )
-    return {"api_key": token}
+    token, expires_in = issue_token()
+    return {"api_key": token, "expires_in": expires_in}
 
 
 @router.get(
@@ -62,16 +92,16 @@ async def get_token(_req: Request):
     response_model=OrganizationOut,
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(2)],
 )
 async def organization_by_self_id(
     _req: Request,
+    fieldset: OrgFieldset,
     org_id: int = Query(..., description="ID организации"),
-) -> JSONResponse:
-    model = await Database.get_organization_by_id(org_id)
+) -> Response:
+    model = await Database.get_organization_by_id(org_id, fieldset)
     if model:
-        model = OrganizationOut.model_validate(model).model_dump(exclude_none=True)
-        return model
+        return model_response(sparse_model(OrganizationOut, fieldset), model)
 
     return JSONResponse(
         {
@@ -88,20 +118,35 @@ async def organization_by_self_id(
     response_model=List[OrganizationOut],
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(3)],
 )
 async def search_for_organizations_h(
     _req: Request,
+    fieldset: OrgFieldset,
+    page: Paging,
     query: str = Query(..., description="Подстрока для поиска в названии организации"),
-) -> JSONResponse:
-    result = await Database.search_for_organizations(query)
-    if result:
-        result = [
-            OrganizationOut.model_validate(model).model_dump(exclude_none=True)
-            for model in result
-        ]
-
-        return result
+    fuzzy: bool = Query(
+        False,
+        description="Если True — нечёткий поиск, устойчивый к опечаткам",
+    ),
+    min_score: float | None = Query(
+        None,
+        ge=0,
+        le=1,
+        description="Минимальная схожесть для нечёткого поиска (0..1)",
+    ),
+) -> Response:
+    result = await Database.search_for_organizations(
+        query,
+        page,
+        fuzzy=fuzzy,
+        min_score=Config.SEARCH_MIN_SIMILARITY if min_score is None else min_score,
+        fieldset=fieldset,
+    )
+    if result and result.items:
+        headers = {CURSOR_HEADER: result.cursor} if result.cursor else None
+        model = sparse_model(OrganizationOut, fieldset)
+        return list_response(model, result.items, headers=headers)
 
     return JSONResponse(
         {
@@ -118,21 +163,28 @@ async def search_for_organizations_h(
     response_model=List[OrganizationOut],
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(2)],
 )
 async def organizations_by_building_id(
     _req: Request,
+    fieldset: OrgFieldset,
+    page: Paging,
     building_id: int = Query(..., description="ID здания"),
-) -> JSONResponse:
-    result = await Database.get_organizations_by_bid(building_id)
-
-    if result:
-        result = [
-            OrganizationOut.model_validate(model).model_dump(exclude_none=True)
-            for model in result
-        ]
+) -> Response:
+    result = await Database.get_organizations_by_bid(
+        building_id,
+        page,
+        as_json=Config.PG_JSON_READS,
+        fieldset=fieldset,
+    )
 
-        return result
+    if result and result.items:
+        headers = {CURSOR_HEADER: result.cursor} if result.cursor else None
+        if Config.PG_JSON_READS:
+            docs = [doc.json for doc in result.items]
+            return json_list_response(docs, headers=headers)
+        model = sparse_model(OrganizationOut, fieldset)
+        return list_response(model, result.items, headers=headers)
 
     return JSONResponse(
         {
@@ -149,10 +201,12 @@ async def organizations_by_building_id(
     response_model=List[OrganizationOut],
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(2)],
 )
 async def organizations_by_activity_label(
     _req: Request,
+    fieldset: OrgFieldset,
+    page: Paging,
     label: str = Query(..., description="Название деятельности"),
     strict: bool = Query(
         False,
@@ -161,16 +215,22 @@ async def organizations_by_activity_label(
             "Если False — включает потомков или совпадающих по иерархии.",
         ),
     ),
-) -> JSONResponse:
-    result = await Database.get_organizations_by_activity(label, strict=strict)
-
-    if result:
-        result = [
-            OrganizationOut.model_validate(model).model_dump(exclude_none=True)
-            for model in result
-        ]
+) -> Response:
+    result = await Database.get_organizations_by_activity(
+        label,
+        page,
+        strict=strict,
+        as_json=Config.PG_JSON_READS,
+        fieldset=fieldset,
+    )
 
-        return result
+    if result and result.items:
+        headers = {CURSOR_HEADER: result.cursor} if result.cursor else None
+        if Config.PG_JSON_READS:
+            docs = [doc.json for doc in result.items]
+            return json_list_response(docs, headers=headers)
+        model = sparse_model(OrganizationOut, fieldset)
+        return list_response(model, result.items, headers=headers)
 
     return JSONResponse(
         {
@@ -187,23 +247,26 @@ async def organizations_by_activity_label(
     response_model=List[OrganizationOut],
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(2)],
 )
 async def organizations_in_radius_m(
     _req: Request,
+    fieldset: OrgFieldset,
+    point: Point,
+    page: Paging,
     radius: float = Query(..., description="Радиус в метрах"),
-    lat: float = Query(..., description="Широта точки"),
-    lon: float = Query(..., description="Долгота точки"),
-) -> JSONResponse:
-    result = await Database.organizations_within_radius(lat, lon, radius)
-
-    if result:
-        result = [
-            OrganizationOut.model_validate(model).model_dump(exclude_none=True)
-            for model in result
-        ]
+) -> Response:
+    result = await Database.organizations_within_radius(
+        point,
+        radius,
+        page,
+        fieldset,
+    )
 
-        return result
+    if result and result.items:
+        headers = {CURSOR_HEADER: result.cursor} if result.cursor else None
+        model = sparse_model(OrganizationOut, fieldset)
+        return list_response(model, result.items, headers=headers)
 
     return JSONResponse(
         {
@@ -220,23 +283,106 @@ async def organizations_in_radius_m(
     response_model=List[BuildingOut],
     status_code=200,
     tags=["GET Запросы"],
-    dependencies=[Depends(check_key)],
+    dependencies=[Depends(check_key), query_budget(1)],
 )
 async def buildings_in_radius_m(
     _req: Request,
+    point: Point,
+    page: Paging,
     radius: float = Query(..., description="Радиус в метрах"),
-    lat: float = Query(..., description="Широта точки"),
-    lon: float = Query(..., description="Долгота точки"),
-) -> JSONResponse:
-    result = await Database.buildings_within_radius(lat, lon, radius)
+) -> Response:
+    result = await Database.buildings_within_radius(point, radius, page)
+
+    if result and result.items:
+        headers = {CURSOR_HEADER: result.cursor} if result.cursor else None
+        return list_response(BuildingOut, result.items, headers=headers)
+
+    return JSONResponse(
+        {
+            "status": "failed",
+            "message": "Not Found",
+        },
+        status_code=404,
+    )
+
+
+@router.get(
+    "/api/organizations/nearest",
+    summary="Получить ближайшие к точке организации",
+    response_model=List[OrganizationNearOut],
+    status_code=200,
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key), query_budget(2)],
+)
+async def organizations_nearest(
+    _req: Request,
+    fieldset: OrgFieldset,
+    point: Point,
+    k: int = Query(10, ge=1, le=100, description="Количество организаций"),
+    activity: str | None = Query(None, description="Название деятельности"),
+    strict: bool = Query(
+        False,
+        description="Если True — фильтр по деятельности без учёта потомков",
+    ),
+) -> Response:
+    result = await Database.nearest_organizations(
+        point,
+        k,
+        activity,
+        strict,
+        fieldset,
+    )
 
     if result:
-        result = [
-            BuildingOut.model_validate(model).model_dump(exclude_none=True)
-            for model in result
+        base = sparse_model(OrganizationOut, fieldset)
+        near = sparse_model(OrganizationNearOut, fieldset)
+        models = [
+            near(**dict(base.model_validate(model)), distance=distance)
+            for model, distance in result
         ]
+        return ModelResponse(models)
+
+    return JSONResponse(
+        {
+            "status": "failed",
+            "message": "Not Found",
+        },
+        status_code=404,
+    )
 
-        return result
+
+@router.get(
+    "/api/buildings/nearest",
+    summary="Получить ближайшие к точке здания",
+    response_model=List[BuildingNearOut],
+    status_code=200,
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key), query_budget(1)],
+)
+async def buildings_nearest(
+    _req: Request,
+    point: Point,
+    k: int = Query(10, ge=1, le=100, description="Количество зданий"),
+    activity: str | None = Query(
+        None,
+        description="Название деятельности хотя бы одной организации в здании",
+    ),
+    strict: bool = Query(
+        False,
+        description="Если True — фильтр по деятельности без учёта потомков",
+    ),
+) -> Response:
+    result = await Database.nearest_buildings(point, k, activity, strict)
+
+    if result:
+        models = [
+            BuildingNearOut(
+                **dict(BuildingOut.model_validate(model)),
+                distance=distance,
+            )
+            for model, distance in result
+        ]
+        return ModelResponse(models)
 
     return JSONResponse(
         {
@@ -247,6 +393,78 @@ async def buildings_in_radius_m(
     )
 
 
+@router.get(
+    "/api/organizations/export",
+    summary="Выгрузить все организации (NDJSON или CSV)",
+    status_code=200,
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key)],
+    responses={200: {"content": {media: {} for media in MEDIA_TYPES.values()}}},
+)
+async def organizations_export(
+    _req: Request,
+    fmt: Literal["ndjson", "csv"] = Query(
+        "ndjson",
+        alias="format",
+        description="Формат выгрузки: ndjson — объект OrganizationOut на строку",
+    ),
+) -> StreamingResponse:
+    return StreamingResponse(
+        export_body(Database.stream_organizations(), fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="organizations.{fmt}"',
+        },
+    )
+
+
+@router.get(
+    "/api/activities/tree",
+    summary="Получить дерево деятельностей",
+    response_model=List[ActivityNodeOut],
+    status_code=200,
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key), query_budget(1)],
+)
+async def activities_tree(_req: Request) -> Response:
+    tree = await Database.activity_tree()
+    body = json.dumps(tree.as_list(), ensure_ascii=False, separators=(",", ":"))
+    return ModelResponse(body.encode())
+
+
+@router.get(
+    "/api/cache/stats",
+    summary="Статистика кэша чтения",
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key)],
+)
+async def cache_stats(_req: Request) -> JSONResponse:
+    return JSONResponse(Database.cache_stats())
+
+
+@router.get(
+    "/api/admin/slowQueries",
+    summary="Самые медленные запросы к БД с момента запуска",
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key)],
+)
+async def slow_queries(
+    _req: Request,
+    limit: int = Query(20, ge=1, le=200, description="Количество запросов"),
+) -> JSONResponse:
+    return JSONResponse(Database.slow_queries(limit))
+
+
+@router.get(
+    "/api/admin/replicas",
+    summary="Состояние реплик для чтения",
+    tags=["GET Запросы"],
+    dependencies=[Depends(check_key)],
+)
+async def replicas(_req: Request) -> JSONResponse:
+    return JSONResponse(Database.replica_stats())
+
+
 """
 DELETE REQUESTS
 """
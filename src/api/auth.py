@@ -0,0 +1,152 @@
+import hashlib
+import uuid
+from collections import OrderedDict
+from time import time
+from typing import Dict, Tuple
+
+import jwt
+from fastapi import Security
+from fastapi.exceptions import HTTPException
+from fastapi.security import APIKeyHeader
+from loguru import logger
+
+from config import Config
+from database.dao import Database
+from database.replicas import current_client
+
+API_KEY_NAME = "X-API-KEY"
+api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
+
+ALGO = "HS256"
+SCOPE = "api-access"
+REVOKED_EVENT = "revoked_token"
+
+
+def key_id(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()[:8]
+
+
+# Tokens are signed with SECRET and carry its kid. After a rotation the old
+# secret goes to SECRET_PREVIOUS and only verifies: its tokens keep working
+# until their exp, then it can be dropped.
+CURRENT_KID = key_id(Config.SECRET)
+KEYS = {CURRENT_KID: Config.SECRET}
+if Config.SECRET_PREVIOUS:
+    KEYS[key_id(Config.SECRET_PREVIOUS)] = Config.SECRET_PREVIOUS
+
+
+class VerifiedTokens:
+    # sha256 of the token -> (exp, jti) for tokens whose signature checked out.
+    # A hit skips the HMAC, never the exp or revocation checks.
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._data: OrderedDict[bytes, Tuple[float, str]] = OrderedDict()
+        self._revoked: Dict[str, float] = {}  # jti -> exp
+
+    def get(self, digest: bytes) -> Tuple[float, str] | None:
+        entry = self._data.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(digest)
+        self.hits += 1
+        return entry
+
+    def add(self, digest: bytes, exp: float, jti: str):
+        if not self.maxsize:
+            return
+
+        self._data[digest] = (exp, jti)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def revoke(self, jti: str, exp: float):
+        now = time()
+        # past exp a token is rejected anyway, no need to remember it
+        self._revoked = {j: e for j, e in self._revoked.items() if e > now}
+        self._revoked[jti] = exp
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revoked": len(self._revoked),
+        }
+
+
+TOKENS = VerifiedTokens(Config.AUTH_CACHE_SIZE)
+Database.subscribe(REVOKED_EVENT, lambda event: TOKENS.revoke(**event))
+
+
+def issue_token() -> Tuple[str, int]:
+    now = int(time())
+    token = jwt.encode(
+        {
+            "iat": now,
+            "exp": now + Config.TOKEN_TTL,
+            "jti": uuid.uuid4().hex,
+            "scope": SCOPE,
+        },
+        Config.SECRET,
+        algorithm=ALGO,
+        headers={"kid": CURRENT_KID},
+    )
+    return token, Config.TOKEN_TTL
+
+
+def _verify(api_key: str) -> Tuple[float, str]:
+    try:
+        kid = jwt.get_unverified_header(api_key).get("kid", CURRENT_KID)
+        secret = KEYS.get(kid)
+        if secret is None:
+            raise jwt.InvalidKeyError(f"unknown kid {kid}")
+        data = jwt.decode(
+            api_key,
+            secret,
+            algorithms=[ALGO],
+            options={"require": ["exp", "jti"]},
+        )
+    except jwt.PyJWTError as e:
+        raise HTTPException(401, "Неверный API-ключ") from e
+    if data.get("scope") != SCOPE:
+        raise HTTPException(401, "Неверный API-ключ")
+    return data["exp"], data["jti"]
+
+
+def token_claims(api_key: str) -> Tuple[float, str]:
+    digest = hashlib.sha256(api_key.encode()).digest()
+    entry = TOKENS.get(digest)
+    if entry is None:
+        entry = _verify(api_key)
+        TOKENS.add(digest, *entry)
+
+    exp, jti = entry
+    if exp <= time() or TOKENS.is_revoked(jti):
+        raise HTTPException(401, "Неверный API-ключ")
+    return exp, jti
+
+
+async def check_key(api_key: str | None = Security(api_key_header)) -> str:
+    # async so the client set here is visible to the route: sync dependencies
+    # run in a threadpool with a copied context
+    if not api_key:
+        raise HTTPException(401, "Неверный API-ключ")
+    _, jti = token_claims(api_key)
+    current_client.set(jti)
+    return api_key
+
+
+async def revoke_token(api_key: str):
+    exp, jti = token_claims(api_key)
+    TOKENS.revoke(jti, exp)
+    # other workers learn about it through their change listener
+    await Database.publish(REVOKED_EVENT, {"jti": jti, "exp": exp})
+    logger.info("[+] Token {} revoked;", jti)
@@ -0,0 +1,109 @@
+import json
+from time import perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple, Type
+
+from fastapi import Request
+from fastapi.exceptions import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from config import Config
+from database.models import BulkResult, BulkRowError
+
+NDJSON = "application/x-ndjson"
+
+Loader = Callable[
+    [List[Tuple[int, Any]]],
+    Awaitable[Tuple[List[int], List[Tuple[int, str]]]],
+]
+
+openapi_body = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {}}},
+            NDJSON: {
+                "schema": {"type": "string", "description": "JSON-объект на строку"},
+            },
+        },
+    },
+}
+
+
+async def _ndjson_lines(req: Request) -> AsyncIterator[bytes]:
+    # the body is consumed as it arrives, never held in memory whole
+    tail = b""
+    async for chunk in req.stream():
+        *lines, tail = (tail + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    yield tail
+
+
+async def _raw_rows(req: Request) -> AsyncIterator[Any]:
+    if req.headers.get("content-type", "").split(";")[0].strip() == NDJSON:
+        async for line in _ndjson_lines(req):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+        return
+
+    try:
+        rows = json.loads(await req.body())
+    except ValueError as e:
+        raise HTTPException(400, "Неверный JSON") from e
+    if not isinstance(rows, list):
+        raise HTTPException(400, "Ожидается массив объектов")
+
+    for row in rows:
+        yield row
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors()
+    )
+
+
+async def bulk_load(req: Request, model: Type[BaseModel], loader: Loader) -> BulkResult:
+    started = perf_counter()
+
+    created: List[int] = []
+    errors: List[Tuple[int, str]] = []
+    chunk: List[Tuple[int, BaseModel]] = []
+    received = 0
+
+    async def flush():
+        ids, row_errors = await loader(chunk)
+        created.extend(ids)
+        errors.extend(row_errors)
+        chunk.clear()
+
+    async for raw in _raw_rows(req):
+        index, received = received, received + 1
+
+        if isinstance(raw, ValueError):
+            errors.append((index, "invalid JSON"))
+            continue
+        try:
+            chunk.append((index, model.model_validate(raw)))
+        except ValidationError as e:
+            errors.append((index, _describe(e)))
+            continue
+
+        if len(chunk) >= Config.BULK_CHUNK:
+            await flush()
+
+    if chunk:
+        await flush()
+
+    elapsed = perf_counter() - started
+    return BulkResult(
+        received=received,
+        created=created,
+        failed=len(errors),
+        elapsed=round(elapsed, 4),
+        rows_per_sec=round(received / elapsed, 1) if elapsed else 0.0,
+        errors=[BulkRowError(index=i, error=msg) for i, msg in sorted(errors)],
+    )
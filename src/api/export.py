@@ -0,0 +1,68 @@
+import csv
+import io
+from typing import AsyncIterator, List
+
+from database.models import OrganizationOut
+from database.orm import OrgORM
+
+CSV_HEADER = [
+    "id",
+    "title",
+    "phone",
+    "building_id",
+    "addr",
+    "lat",
+    "lon",
+    "activity_ids",
+    "activities",
+]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _ndjson(orgs: List[OrgORM]) -> bytes:
+    return b"".join(
+        OrganizationOut.model_validate(org).model_dump_json(exclude_none=True).encode()
+        + b"\n"
+        for org in orgs
+    )
+
+
+def _csv(orgs: List[OrgORM]) -> bytes:
+    # list columns are packed into one cell, ";"-separated
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for org in orgs:
+        out = OrganizationOut.model_validate(org)
+        activities = out.activities or []
+        writer.writerow(
+            [
+                out.id,
+                out.title,
+                ";".join(out.phone),
+                out.building.id,
+                out.building.addr,
+                out.building.lat,
+                out.building.lon,
+                ";".join(str(act.id) for act in activities),
+                ";".join(act.label for act in activities),
+            ],
+        )
+    return buf.getvalue().encode()
+
+
+async def export_body(
+    batches: AsyncIterator[List[OrgORM]],
+    fmt: str,
+) -> AsyncIterator[bytes]:
+    # one chunk per DB batch; StreamingResponse awaits each send, so a slow
+    # client stalls the cursor instead of piling rows up in memory
+    encode = _csv if fmt == "csv" else _ndjson
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerow(CSV_HEADER)
+        yield buf.getvalue().encode()
+
+    async for orgs in batches:
+        yield encode(orgs)
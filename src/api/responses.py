@@ -0,0 +1,77 @@
+from functools import lru_cache
+from typing import Any, Iterable, List, Mapping, Type
+
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from utils.fieldsets import FULL, ORG_FIELDS, ORG_RELATIONS, Fieldset
+
+
+# Returned directly from handlers, so FastAPI skips its response_model
+# validation/serialization pass; response_model stays on routes for OpenAPI.
+class ModelResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(exclude_none=True).encode()
+        return _list_adapter(type(content[0]) if content else BaseModel).dump_json(
+            content,
+            exclude_none=True,
+        )
+
+
+@lru_cache
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+@lru_cache
+def sparse_model(model: Type[BaseModel], fieldset: Fieldset) -> Type[BaseModel]:
+    # model without the fields the fieldset leaves out: validating from an ORM
+    # object then never touches columns or relations that were not loaded
+    if fieldset == FULL:
+        return model
+
+    optional = {*ORG_FIELDS, *ORG_RELATIONS}
+    fields = {
+        name: (info.annotation, info)
+        for name, info in model.model_fields.items()
+        if name not in optional or fieldset.includes(name)
+    }
+    return create_model(
+        f"{model.__name__}Sparse",
+        __config__=model.model_config,
+        **fields,
+    )
+
+
+def model_response(
+    model: Type[BaseModel],
+    obj: Any,
+    headers: Mapping[str, str] | None = None,
+) -> ModelResponse:
+    return ModelResponse(model.model_validate(obj), headers=headers)
+
+
+def list_response(
+    model: Type[BaseModel],
+    objs: Iterable[Any],
+    headers: Mapping[str, str] | None = None,
+) -> ModelResponse:
+    adapter = _list_adapter(model)
+    body = adapter.dump_json(
+        adapter.validate_python(objs, from_attributes=True),
+        exclude_none=True,
+    )
+    return ModelResponse(body, headers=headers)
+
+
+def json_list_response(
+    docs: Iterable[str],
+    headers: Mapping[str, str] | None = None,
+) -> ModelResponse:
+    # documents already serialized by Postgres, passed through untouched
+    return ModelResponse(f"[{','.join(docs)}]".encode(), headers=headers)
@@ -0,0 +1,110 @@
+"""Round trips per /api/organization/create, legacy flow vs single statement.
+
+    cd src && python -m bench.create_org [-n 200]
+
+Needs a seeded database (see test_data.py); the created orgs are removed.
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from time import perf_counter
+
+from sqlalchemy import delete, event, select
+
+from config import Config
+from database.dao import Database, org_tags
+from database.models import OrganizationIn
+from database.orm import ActORM, BuildORM, OrgORM, RelationshipAO
+from database.settings import DatabaseSettings
+
+
+class RoundTrips:
+    # BEGIN is sent by asyncpg when the first statement runs, so every
+    # transaction costs begin + statements + commit/rollback
+    def __init__(self, engine):
+        self.count = 0
+        for name in ("begin", "before_cursor_execute", "commit", "rollback"):
+            event.listen(engine.sync_engine, name, self._hit)
+
+    def _hit(self, *_args, **_kwargs):
+        self.count += 1
+
+
+async def legacy_create_organization(org_model: OrganizationIn) -> OrgORM:
+    # Database.create_organization before it became one statement
+    async with Database._sessionmaker() as session:
+        org_obj = OrgORM(
+            title=org_model.title,
+            phone=org_model.phone,
+            b_id=org_model.building_id,
+        )
+        session.add(org_obj)
+        await session.commit()
+        await session.refresh(org_obj)
+
+        session.add_all(
+            [
+                RelationshipAO(org_id=org_obj.id, act_id=act_id)
+                for act_id in org_model.activity_ids
+            ],
+        )
+        await Database._commit(
+            session,
+            *org_tags(org_obj),
+            *await Database._activity_tags(session, org_model.activity_ids),
+        )
+        await session.refresh(org_obj, attribute_names=["building", "activities"])
+        return org_obj
+
+
+async def run(name, create, n, refs, trips):
+    trips.count = 0
+    started = perf_counter()
+
+    for _ in range(n):
+        await create(
+            OrganizationIn(
+                title=f"bench {uuid.uuid4().hex}",
+                phone=["70000000000"],
+                **refs,
+            ),
+        )
+
+    elapsed = perf_counter() - started
+    return {
+        "variant": name,
+        "requests": n,
+        "round_trips": trips.count / n,
+        "ms_per_request": round(elapsed / n * 1000, 3),
+    }
+
+
+async def main(n: int):
+    await Database.init(Config.DB_URL, DatabaseSettings(pool_size=Config.DB_MAXCON))
+    trips = RoundTrips(Database._engine)
+
+    async with Database._sessionmaker() as session:
+        b_id = (await session.execute(select(BuildORM.id).limit(1))).scalar_one()
+        act_ids = (await session.execute(select(ActORM.id).limit(2))).scalars().all()
+    refs = {"building_id": b_id, "activity_ids": act_ids}
+
+    try:
+        results = [
+            await run("legacy", legacy_create_organization, n, refs, trips),
+            await run("single", Database.create_organization, n, refs, trips),
+        ]
+    finally:
+        async with Database._sessionmaker() as session:
+            await session.execute(delete(OrgORM).where(OrgORM.title.like("bench %")))
+            await session.commit()
+        await Database.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200, help="requests per variant")
+    asyncio.run(main(parser.parse_args().n))
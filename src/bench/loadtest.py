@@ -0,0 +1,363 @@
+"""End-to-end load test against a running app, over plain HTTP/1.1.
+
+    cd src && PGHOST=localhost python datagen.py --orgs 100000
+    cd src && uvicorn start:app --port 8000 --workers 4
+    cd src && python -m bench.loadtest --steps 1,2,4,8,16,32,64 --out curve.json
+    cd src && python -m bench.loadtest --rate --steps 100,200,400,800
+
+Each step replays the request mix for --duration seconds, either at a fixed
+concurrency (closed loop) or, with --rate, at a fixed arrival rate in
+requests per second (open loop). Open-loop latency counts from the scheduled
+send time, so a server falling behind shows up as queueing, not as fewer
+requests. Sample ids, labels and points are taken from the running app and
+from datagen's vocabulary.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+from itertools import pairwise
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import h11
+
+from bench.suite import _revision, percentile
+from datagen import CITIES, ENDINGS, FORMS, STEMS
+
+DEFAULT_MIX = "byId=40,byTitle=15,inRadius=15,byActivity=15,create=5,update=10"
+
+Request = Tuple[str, str, Any]
+
+
+class Connection:
+    # one keep-alive connection; h11 is already installed with uvicorn
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.writer = None
+
+    async def request(
+        self,
+        method: str,
+        target: str,
+        headers: List[Tuple[str, str]],
+        body: bytes = b"",
+    ) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host,
+                self.port,
+            )
+            self.conn = h11.Connection(h11.CLIENT)
+
+        headers = [("host", self.host), *headers]
+        if body:
+            headers += [
+                ("content-type", "application/json"),
+                ("content-length", str(len(body))),
+            ]
+        request = h11.Request(method=method, target=target, headers=headers)
+        data = self.conn.send(request)
+        if body:
+            data += self.conn.send(h11.Data(data=body))
+        data += self.conn.send(h11.EndOfMessage())
+        self.writer.write(data)
+        await self.writer.drain()
+
+        status, content = await self._response()
+        if self.conn.our_state is h11.DONE and self.conn.their_state is h11.DONE:
+            self.conn.start_next_cycle()
+        else:
+            await self.close()
+        return status, content
+
+    async def _response(self) -> Tuple[int, bytes]:
+        status, chunks = 0, []
+        while True:
+            event = self.conn.next_event()
+            if event is h11.NEED_DATA:
+                self.conn.receive_data(await self.reader.read(65536))
+            elif isinstance(event, h11.Response):
+                status = event.status_code
+            elif isinstance(event, h11.Data):
+                chunks.append(event.data)
+            elif isinstance(event, h11.EndOfMessage):
+                return status, b"".join(chunks)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def discover(conn: Connection, headers) -> Dict[str, list]:
+    _, body = await conn.request("GET", "/api/activities/tree", headers)
+    nodes, act_ids, labels = json.loads(body), [], []
+    while nodes:
+        node = nodes.pop()
+        act_ids.append(node["id"])
+        labels.append(node["label"])
+        nodes.extend(node["children"])
+
+    org_ids, b_ids = set(), set()
+    for _, lat, lon, _ in CITIES:
+        query = urlencode({"lat": lat, "lon": lon, "k": 100})
+        _, body = await conn.request(
+            "GET",
+            f"/api/organizations/nearest?{query}",
+            headers,
+        )
+        for org in json.loads(body):
+            org_ids.add(org["id"])
+            b_ids.add(org["building"]["id"])
+
+    if not org_ids or not act_ids:
+        raise SystemExit("no organizations found, load some with datagen.py first")
+    return {
+        "org_ids": sorted(org_ids),
+        "b_ids": sorted(b_ids),
+        "act_ids": act_ids,
+        "labels": labels,
+    }
+
+
+def _point(rng: random.Random) -> Dict[str, float]:
+    _, lat, lon, _ = rng.choice(CITIES)
+    return {
+        "lat": round(rng.gauss(lat, 0.05), 6),
+        "lon": round(rng.gauss(lon, 0.08), 6),
+    }
+
+
+def _phone(rng: random.Random) -> List[str]:
+    return [f"7{rng.randrange(10**9, 10**10)}"]
+
+
+ROUTES: Dict[str, Callable[[random.Random, Dict[str, list]], Request]] = {
+    "byId": lambda rng, d: (
+        "GET",
+        f"/api/organization/byId/?org_id={rng.choice(d['org_ids'])}",
+        None,
+    ),
+    "byTitle": lambda rng, _d: (
+        "GET",
+        "/api/organizations/byTitle/?"
+        + urlencode({"query": rng.choice(STEMS) + rng.choice(ENDINGS), "limit": 20}),
+        None,
+    ),
+    "inRadius": lambda rng, _d: (
+        "GET",
+        "/api/organizations/inRadius/?"
+        + urlencode({"radius": 1000, **_point(rng), "limit": 50}),
+        None,
+    ),
+    "byActivity": lambda rng, d: (
+        "GET",
+        "/api/organizations/byActivity/?"
+        + urlencode({"label": rng.choice(d["labels"]), "limit": 50}),
+        None,
+    ),
+    "create": lambda rng, d: (
+        "POST",
+        "/api/organization/create",
+        {
+            "title": f"{rng.choice(FORMS)} «Нагрузка {rng.getrandbits(32):x}»",
+            "phone": _phone(rng),
+            "building_id": rng.choice(d["b_ids"]),
+            "activity_ids": rng.sample(d["act_ids"], 2),
+        },
+    ),
+    "update": lambda rng, d: (
+        "PUT",
+        "/api/organization/update",
+        {"id": rng.choice(d["org_ids"]), "phone": _phone(rng)},
+    ),
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise SystemExit(f"unknown route {name!r}, expected one of {list(ROUTES)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Step:
+    def __init__(self, mix: Dict[str, float], data, headers, seed: int):
+        self.names, self.weights = list(mix), list(mix.values())
+        self.data = data
+        self.headers = headers
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = dict.fromkeys(mix, 0)
+
+    async def fire(self, conn: Connection, scheduled: float):
+        name = self.rng.choices(self.names, self.weights)[0]
+        method, target, payload = ROUTES[name](self.rng, self.data)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        try:
+            status, _ = await conn.request(method, target, self.headers, body)
+        except (OSError, h11.ProtocolError):
+            status = 0
+            await conn.close()
+
+        self.latencies[name].append(perf_counter() - scheduled)
+        if not 200 <= status < 300:  # noqa: PLR2004
+            self.errors[name] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        routes = {
+            name: _summary(self.latencies[name], self.errors[name], elapsed)
+            for name in self.names
+        }
+        total = _summary(
+            [ms for latencies in self.latencies.values() for ms in latencies],
+            sum(self.errors.values()),
+            elapsed,
+        )
+        return {"total": total, "routes": routes}
+
+
+def _summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(s * 1000 for s in latencies)
+    if not ordered:
+        return {"n": 0, "errors": errors}
+    return {
+        "n": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2),
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+    }
+
+
+async def closed_loop(step: Step, address, concurrency: int, duration: float) -> float:
+    deadline = perf_counter() + duration
+
+    async def worker():
+        conn = Connection(*address)
+        while perf_counter() < deadline:
+            await step.fire(conn, perf_counter())
+        await conn.close()
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return perf_counter() - started
+
+
+async def open_loop(step: Step, address, rate: float, duration: float, limit: int):
+    # Poisson arrivals; past `limit` open connections arrivals queue client
+    # side, which still counts against their latency
+    idle: List[Connection] = []
+    slots = asyncio.Semaphore(limit)
+    tasks = set()
+
+    async def arrival(scheduled: float):
+        async with slots:
+            conn = idle.pop() if idle else Connection(*address)
+            await step.fire(conn, scheduled)
+            idle.append(conn)
+
+    started = perf_counter()
+    scheduled = started
+    while True:
+        scheduled += step.rng.expovariate(rate)
+        if scheduled >= started + duration:
+            break
+        await asyncio.sleep(max(0.0, scheduled - perf_counter()))
+        task = asyncio.create_task(arrival(scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks)
+    for conn in idle:
+        await conn.close()
+    return perf_counter() - started
+
+
+def knee(curve: List[Dict[str, Any]], gain: float = 0.1) -> float | None:
+    # last level whose successor adds less than `gain` throughput
+    for prev, step in pairwise(curve):
+        if step["total"].get("rps", 0) < prev["total"].get("rps", 0) * (1 + gain):
+            return prev["level"]
+    return None
+
+
+async def main(args):
+    url = urlsplit(args.url)
+    address = (url.hostname, url.port or 80)
+    mix = parse_mix(args.mix)
+
+    conn = Connection(*address)
+    _, body = await conn.request("GET", "/api/token", [])
+    headers = [("x-api-key", json.loads(body)["api_key"])]
+    data = await discover(conn, headers)
+    await conn.close()
+
+    async def run(level: float, duration: float, seed: int) -> Tuple[Step, float]:
+        step = Step(mix, data, headers, seed)
+        if args.rate:
+            elapsed = await open_loop(step, address, level, duration, args.max_conn)
+        else:
+            elapsed = await closed_loop(step, address, int(level), duration)
+        return step, elapsed
+
+    levels = [float(level) for level in args.steps.split(",")]
+    if args.warmup:
+        await run(levels[0], args.warmup, args.seed)
+
+    curve = []
+    for i, level in enumerate(levels):
+        step, elapsed = await run(level, args.duration, args.seed + i)
+        curve.append({"level": level, **step.report(elapsed)})
+        total = curve[-1]["total"]
+        print(
+            f"{'rate' if args.rate else 'concurrency'} {level:>8g}"
+            f"  rps {total.get('rps', 0):>9}  p50 {total.get('p50_ms')}"
+            f"  p99 {total.get('p99_ms')}  errors {total['errors']}",
+            file=sys.stderr,
+        )
+
+    report = {
+        "meta": {
+            "revision": _revision(),
+            "url": args.url,
+            "mode": "rate" if args.rate else "concurrency",
+            "mix": mix,
+            "duration": args.duration,
+            "seed": args.seed,
+            "organizations_sampled": len(data["org_ids"]),
+        },
+        "knee": knee(curve),
+        "steps": curve,
+    }
+    print(f"knee: {report['knee']}", file=sys.stderr)
+
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight,...")
+    parser.add_argument("--rate", action="store_true", help="steps are requests/s")
+    parser.add_argument("--steps", default="1,2,4,8,16,32", help="levels to sweep")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per step")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds, discarded")
+    parser.add_argument("--max-conn", type=int, default=256, help="open-loop cap")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
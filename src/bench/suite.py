@@ -0,0 +1,302 @@
+"""DAO and serialization benchmarks against a local Postgres/PostGIS.
+
+    cd src && PGHOST=localhost python -m bench.suite --scale 100k --reseed > run.json
+    cd src && PGHOST=localhost python -m bench.suite --no-seed --baseline run.json
+
+--scale must match the number of organizations in the database; with
+--reseed a mismatch drops every table in it and seeds that many instead.
+--no-seed benchmarks whatever is there.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import sys
+from statistics import mean
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy import func, select
+
+from api.responses import list_response
+from config import Config
+from database.dao import Database
+from database.models import (
+    ActivityIn,
+    BuildingDelete,
+    BuildingIn,
+    BuildingUpdate,
+    OrganizationDelete,
+    OrganizationIn,
+    OrganizationOut,
+    OrganizationUpdate,
+)
+from database.orm import ActORM, BuildORM, OrgORM
+from database.settings import DatabaseSettings
+from datagen import generate
+from utils.geo import GeoPoint
+from utils.pagination import PageParams
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+PAGE = PageParams(50)
+
+Case = Callable[[random.Random], Awaitable[Any]]
+
+
+def _point(rng: random.Random) -> Dict[str, float]:
+    return {"lat": 55.75 + rng.gauss(0, 0.1), "lon": 37.62 + rng.gauss(0, 0.15)}
+
+
+async def dataset() -> Dict[str, List]:
+    async with Database._sessionmaker() as session:
+        return {
+            "org_ids": (await session.execute(select(OrgORM.id))).scalars().all(),
+            "b_ids": (await session.execute(select(BuildORM.id))).scalars().all(),
+            "act_ids": (await session.execute(select(ActORM.id))).scalars().all(),
+            "labels": (await session.execute(select(ActORM.label).distinct()))
+            .scalars()
+            .all(),
+        }
+
+
+def cases(data: Dict[str, List]) -> Dict[str, Case]:
+    org_ids, b_ids, act_ids, labels = (
+        data["org_ids"],
+        data["b_ids"],
+        data["act_ids"],
+        data["labels"],
+    )
+    created: List[int] = []
+    serialized = []
+
+    async def create_organization(rng):
+        org = await Database.create_organization(
+            OrganizationIn(
+                title=f"bench {rng.getrandbits(64):x}",
+                phone=["70000000000"],
+                building_id=rng.choice(b_ids),
+                activity_ids=rng.sample(act_ids, 2),
+            ),
+        )
+        created.append(org.id)
+
+    async def delete_organization(_rng):
+        if created:
+            await Database.delete_organization(OrganizationDelete(id=created.pop()))
+
+    async def create_and_delete_building(rng):
+        build = await Database.create_building(
+            BuildingIn(addr=f"bench {rng.getrandbits(64):x}", **_point(rng)),
+        )
+        await Database.delete_building(BuildingDelete(id=build.id))
+
+    async def serialize_page(_rng):
+        if not serialized:
+            serialized.extend(
+                (await Database.get_organizations_by_bid(b_ids[0], PAGE)).items,
+            )
+        list_response(OrganizationOut, serialized)
+
+    return {
+        "get_organization_by_id": lambda rng: Database.get_organization_by_id(
+            rng.choice(org_ids),
+        ),
+        "get_organizations_by_bid": lambda rng: Database.get_organizations_by_bid(
+            rng.choice(b_ids),
+            PAGE,
+        ),
+        "get_organizations_by_activity": lambda rng: (
+            Database.get_organizations_by_activity(rng.choice(labels), PAGE)
+        ),
+        "get_organizations_by_activity_strict": lambda rng: (
+            Database.get_organizations_by_activity(
+                rng.choice(labels),
+                PAGE,
+                strict=True,
+            )
+        ),
+        "search_for_organizations": lambda rng: Database.search_for_organizations(
+            f"{rng.randrange(1000)}",
+            PAGE,
+        ),
+        "search_for_organizations_fuzzy": lambda _rng: (
+            Database.search_for_organizations("Гарантсервиз", PAGE, fuzzy=True)
+        ),
+        "organizations_within_radius": lambda rng: (
+            Database.organizations_within_radius(GeoPoint(**_point(rng)), 1000, PAGE)
+        ),
+        "buildings_within_radius": lambda rng: Database.buildings_within_radius(
+            GeoPoint(**_point(rng)),
+            1000,
+            PAGE,
+        ),
+        "nearest_organizations": lambda rng: Database.nearest_organizations(
+            GeoPoint(**_point(rng)),
+            k=10,
+        ),
+        "nearest_buildings": lambda rng: Database.nearest_buildings(
+            GeoPoint(**_point(rng)),
+            k=10,
+        ),
+        "create_organization": create_organization,
+        "update_organization": lambda rng: Database.update_organization(
+            OrganizationUpdate(
+                id=rng.choice(org_ids),
+                phone=[f"7{rng.randrange(10**9, 10**10)}"],
+            ),
+        ),
+        "delete_organization": delete_organization,
+        "create_delete_building": create_and_delete_building,
+        "update_building": lambda rng: Database.update_building(
+            BuildingUpdate(id=rng.choice(b_ids), **_point(rng)),
+        ),
+        "create_activity": lambda rng: Database.create_activity(
+            ActivityIn(labels=["Бенчмарк", f"Узел {rng.randrange(100)}"]),
+        ),
+        "serialize_organization_page": serialize_page,
+    }
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    # nearest-rank
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+async def measure(case: Case, rng: random.Random, args) -> Dict[str, Any]:
+    for _ in range(args.warmup):
+        await case(rng)
+
+    latencies: List[float] = []
+    remaining = iter(range(args.iterations))
+
+    async def worker():
+        for _ in remaining:
+            started = perf_counter()
+            await case(rng)
+            latencies.append(perf_counter() - started)
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = perf_counter() - started
+
+    ordered = sorted(ms * 1000 for ms in latencies)
+    return {
+        "n": len(ordered),
+        "ops_per_sec": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(mean(ordered), 3),
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:40} p50 {_delta(old['p50_ms'], result['p50_ms'])}"
+            f"  p99 {_delta(old['p99_ms'], result['p99_ms'])}"
+            f"  ops/s {_delta(old['ops_per_sec'], result['ops_per_sec'])}",
+            file=sys.stderr,
+        )
+
+
+def _delta(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+7.1f}%" if old else "    n/a"
+
+
+def _revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    await Database.init(Config.DB_URL, DatabaseSettings(pool_size=Config.DB_MAXCON))
+
+    try:
+        async with Database._sessionmaker() as session:
+            count = (await session.execute(select(func.count(OrgORM.id)))).scalar_one()
+        if not args.no_seed and count != SCALES[args.scale]:
+            if not args.reseed:
+                raise SystemExit(
+                    f"{Database._engine.url.database} holds {count} organizations, not"
+                    f" {args.scale}: pass --reseed to drop its tables and seed"
+                    " them, or --no-seed to benchmark what is there",
+                )
+            print(f"seeding {args.scale} organizations...", file=sys.stderr)
+            await generate(SCALES[args.scale], args.seed)
+
+        await Database.load_activity_tree()
+        data = await dataset()
+        selected = {
+            name: case
+            for name, case in cases(data).items()
+            if re.search(args.only, name)
+        }
+
+        results = {}
+        for name, case in selected.items():
+            results[name] = await measure(case, random.Random(args.seed), args)
+            print(f"{name:40} {results[name]}", file=sys.stderr)
+    finally:
+        await Database.close()
+
+    report = {
+        "meta": {
+            "revision": _revision(),
+            "python": platform.python_version(),
+            "organizations": len(data["org_ids"]),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "pool_size": Config.DB_MAXCON,
+        },
+        "results": results,
+    }
+
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument("--no-seed", action="store_true", help="use existing data")
+    parser.add_argument(
+        "--reseed",
+        action="store_true",
+        help="drop every table and seed --scale organizations if the count differs",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--only", default="", help="regex over case names")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+
+class ActivityTree:
+    # Immutable snapshot of the activities table; rebuilt whole on change,
+    # readers keep whichever snapshot they picked up.
+    def __init__(self, rows: Iterable[Tuple[int, str, str]]):
+        rows = sorted(rows, key=lambda row: (row[2].count("."), row[0]))
+
+        self.label: Dict[int, str] = {}
+        self.path: Dict[int, str] = {}
+        self.parent: Dict[int, int | None] = {}
+        self.children: Dict[int, List[int]] = {}
+        self.roots: List[int] = []
+        self.by_label: Dict[str, List[int]] = {}
+
+        by_path: Dict[str, int] = {}
+        for act_id, label, path in rows:
+            self.label[act_id] = label
+            self.path[act_id] = path
+            self.children[act_id] = []
+            self.by_label.setdefault(label, []).append(act_id)
+            by_path[path] = act_id
+
+            parent = by_path.get(path.rpartition(".")[0])
+            self.parent[act_id] = parent
+            if parent is None:
+                self.roots.append(act_id)
+            else:
+                self.children[parent].append(act_id)
+
+        # deepest first, so every child's set is ready before its parent's
+        self.descendants: Dict[int, FrozenSet[int]] = {}
+        for act_id, _, _ in reversed(rows):
+            below = (self.descendants[child] for child in self.children[act_id])
+            self.descendants[act_id] = frozenset({act_id}).union(*below)
+
+    def __len__(self) -> int:
+        return len(self.label)
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.by_label
+
+    def subtree_ids(self, label: str, strict: bool = False) -> FrozenSet[int]:
+        ids = self.by_label.get(label, ())
+        if strict:
+            return frozenset(ids)
+        return frozenset().union(*(self.descendants[act_id] for act_id in ids))
+
+    def ancestor_labels(self, act_ids: Iterable[int]) -> set[str]:
+        labels = set()
+        for start in act_ids:
+            node = start
+            while node in self.label:
+                labels.add(self.label[node])
+                node = self.parent[node]
+        return labels
+
+    def as_dict(self, act_id: int) -> Dict[str, Any]:
+        return {
+            "id": act_id,
+            "label": self.label[act_id],
+            "path": self.path[act_id],
+            "children": [self.as_dict(child) for child in self.children[act_id]],
+        }
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [self.as_dict(root) for root in self.roots]
@@ -0,0 +1,140 @@
+import inspect
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Protocol, Set
+
+
+class Cache(Protocol):
+    # bumped by every invalidation; set() drops values computed across one
+    epoch: int
+
+    def get(self, key: Hashable) -> tuple[bool, Any]: ...
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str], epoch: int): ...
+
+    def invalidate(self, tags: Iterable[str]): ...
+
+    def clear(self): ...
+
+    def stats(self) -> Dict[str, int]: ...
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.epoch = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data: OrderedDict[Hashable, tuple[float, Any, frozenset[str]]] = (
+            OrderedDict()
+        )
+        self._tags: Dict[str, Set[Hashable]] = {}
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        entry = self._data.get(key)
+
+        if entry is not None:
+            expires, value, _ = entry
+            if expires > monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, value
+            self._remove(key)
+
+        self.misses += 1
+        return False, None
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str], epoch: int):
+        if epoch != self.epoch:
+            return
+
+        self._remove(key)
+
+        tags = frozenset(tags)
+        self._data[key] = (monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def invalidate(self, tags: Iterable[str]):
+        self.epoch += 1
+
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._remove(key)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+        self._tags.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def call_arguments(
+    signature: inspect.Signature,
+    args: tuple,
+    kwargs: Mapping[str, Any],
+) -> Dict[str, Any]:
+    # positional/keyword spellings of the same call map to the same arguments
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    arguments.pop("cls", None)
+    return arguments
+
+
+# Caches a Database read classmethod in cls._cache; tags(result, arguments)
+# names what the entry depends on so write paths can evict it. Callers for
+# which cls._skip_cache() holds neither read nor fill it.
+def cached(tags: Callable[[Any, Mapping[str, Any]], Iterable[str]]):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        async def wrapper(cls, *args, **kwargs):
+            cache = cls._cache
+            if cache is None or cls._skip_cache():
+                return await func(cls, *args, **kwargs)
+
+            arguments = call_arguments(signature, (cls, *args), kwargs)
+            key = (func.__name__, *arguments.items())
+
+            hit, value = cache.get(key)
+            if hit:
+                return value
+
+            epoch = cache.epoch
+            value = await func(cls, *args, **kwargs)
+            cache.set(key, value, tags(value, arguments), epoch)
+            return value
+
+        return wrapper
+
+    return decorator
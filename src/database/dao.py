@@ -1,14 +1,52 @@
-from typing import List
+import asyncio
+import re
+from time import monotonic, perf_counter
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Tuple,
+)
 
 from geoalchemy2 import Geography
 from loguru import logger
-from sqlalchemy import cast, func, update
+from sqlalchemy import (
+    Integer,
+    String,
+    Text,
+    and_,
+    any_,
+    cast,
+    column,
+    func,
+    insert,
+    literal_column,
+    or_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import (
+    aliased,
+    contains_eager,
+    joinedload,
+    load_only,
+    selectinload,
+)
 from sqlalchemy_utils import Ltree
 
+from database.activity_tree import ActivityTree
+from database.cache import Cache, cached
 from database.models import (
     ActivityIn,
     BuildingDelete,
@@ -16,20 +54,266 @@ from database.models import (
     BuildingUpdate,
     OrganizationDelete,
     OrganizationIn,
+    OrganizationOut,
     OrganizationUpdate,
 )
+from database.notify import CHANNEL, ChangeListener, change_payload, event_payload
 from database.orm import ActORM, BuildORM, OrgORM, RelationshipAO
-from utils.transliteration import translit_table
+from database.replicas import (
+    WRITE_LSN_SQL,
+    ReplicaSet,
+    current_client,
+    read_after,
+    wal_position,
+)
+from database.settings import DatabaseSettings
+from database.singleflight import coalesced, reset_flights, shared_calls
+from database.slow_log import SlowQueryLog
+from utils.fieldsets import FULL, Fieldset
+from utils.geo import GeoPoint
+from utils.metrics import (
+    DAO_INFLIGHT,
+    POOL_CHECKEDOUT,
+    POOL_OVERFLOW,
+    POOL_WAITERS,
+    timed,
+)
+from utils.pagination import (
+    InvalidCursorError,
+    Page,
+    PageParams,
+    decode_cursor,
+    keyset,
+)
+from utils.query_stats import instrument
+from utils.transliteration import to_ltree_label
+
+
+def geo_point(lat: float, lon: float):
+    return cast(
+        func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326),
+        Geography(geometry_type="POINT", srid=4326),
+    )
+
+
+# EXISTS over rel_ao: org has the activity `label` (or, if not strict, a descendant)
+def activity_filter(label: str, strict: bool = False, tree: ActivityTree | None = None):
+    if tree is not None and label in tree:
+        act_ids = sorted(tree.subtree_ids(label, strict))
+        return (
+            select(RelationshipAO.org_id)
+            .where(
+                RelationshipAO.org_id == OrgORM.id,
+                RelationshipAO.act_id == any_(cast(act_ids, ARRAY(Integer))),
+            )
+            .exists()
+        )
+
+    # no trusted snapshot, or a label created by another worker it has not seen
+    matched = aliased(ActORM)
+    stmt = select(RelationshipAO.org_id).join(
+        matched,
+        matched.id == RelationshipAO.act_id,
+    )
+
+    if strict:
+        stmt = stmt.where(matched.label == label)
+    else:
+        parent = aliased(ActORM)
+        stmt = stmt.join(parent, matched.path.descendant_of(parent.path)).where(
+            parent.label == label,
+        )
+
+    return stmt.where(RelationshipAO.org_id == OrgORM.id).exists()
+
+
+# OrganizationOut-shaped document assembled by Postgres; needs BuildORM joined
+def activity_json():
+    return func.json_build_object(
+        "id",
+        ActORM.id,
+        "label",
+        ActORM.label,
+        "path",
+        cast(ActORM.path, Text),
+    )
+
+
+def activities_json(org_id, rels):
+    # rels: rel_ao, or a CTE inserting into it (its rows are not visible
+    # through the table within the same statement)
+    return (
+        select(
+            func.coalesce(
+                func.json_agg(aggregate_order_by(activity_json(), ActORM.id)),
+                literal_column("'[]'::json"),
+            ),
+        )
+        .select_from(ActORM)
+        .join(rels, rels.c.act_id == ActORM.id)
+        .where(rels.c.org_id == org_id)
+        .scalar_subquery()
+    )
+
+
+def building_json():
+    return func.json_build_object(
+        "id",
+        BuildORM.id,
+        "addr",
+        BuildORM.addr,
+        "lat",
+        BuildORM.lat,
+        "lon",
+        BuildORM.lon,
+    )
+
+
+def organization_json(fieldset: Fieldset = FULL):
+    pairs = ["id", OrgORM.id]
+    if "title" in fieldset.fields:
+        pairs += ["title", OrgORM.title]
+    if "phone" in fieldset.fields:
+        pairs += ["phone", OrgORM.phone]
+    if "building" in fieldset.expand:
+        pairs += ["building", building_json()]
+    if "activities" in fieldset.expand:
+        pairs += ["activities", activities_json(OrgORM.id, RelationshipAO.__table__)]
+    return func.json_build_object(*pairs)
+
+
+class OrgDocument(NamedTuple):
+    # an organization serialized by Postgres; id and b_id are selected
+    # whatever the fieldset, for cursors and cache tags
+    id: int
+    b_id: int
+    json: str
+
+
+# Loader options for a fieldset: columns it left out are not selected and
+# relations it did not expand are not queried. b_id is kept for cache tags.
+def org_options(fieldset: Fieldset, building_joined: bool = False) -> list:
+    columns = [getattr(OrgORM, name) for name in sorted(fieldset.fields)]
+    options = [load_only(OrgORM.id, OrgORM.b_id, *columns)]
+    if "building" in fieldset.expand:
+        loader = contains_eager if building_joined else joinedload
+        options.append(loader(OrgORM.building))
+    if "activities" in fieldset.expand:
+        options.append(selectinload(OrgORM.activities))
+    return options
+
+
+# Cache tags: org:<id> and bld:<id> for every organization an entry holds,
+# act:<label> for activity lists. Write paths invalidate the same names;
+# ACTIVITIES_TAG tells other workers to reload their activity tree.
+ACTIVITIES_TAG = "activities"
+
+
+def org_tags(org: OrgORM | OrgDocument) -> Tuple[str, ...]:
+    return f"org:{org.id}", f"bld:{org.b_id}"
+
+
+def org_entry_tags(org: OrgORM | None, arguments: Mapping[str, Any]) -> Iterable[str]:
+    yield f"org:{arguments['org_id']}"
+    if org is not None:
+        yield from org_tags(org)
+
+
+def page_tags(tag: str) -> Callable[[Page, Mapping[str, Any]], Iterable[str]]:
+    def tags(page: Page, arguments: Mapping[str, Any]) -> Iterable[str]:
+        yield tag.format(**arguments)
+        for org in page.items:
+            yield from org_tags(org)
+
+    return tags
+
+
+def unique_rows(rows, key: Callable[[Any], Any], name: str):
+    pending, errors, seen = [], [], set()
+    for index, row in rows:
+        if key(row) in seen:
+            errors.append((index, f"duplicate {name} in request"))
+            continue
+        seen.add(key(row))
+        pending.append((index, row))
+    return pending, errors
 
 
 class Database:
     _engine = None
     _sessionmaker = None
+    _cache: Cache | None = None  # None while the change listener is down
+    _cache_backend: Cache | None = None
+    _listener: ChangeListener | None = None
+    _tree: ActivityTree | None = None
+    _slow_logs: ClassVar[List[SlowQueryLog]] = []
+    _tree_task: asyncio.Task | None = None
+    _replicas: ReplicaSet | None = None
+    _fence = 0.0  # until then cached reads stay on the primary
+    _subscribers: ClassVar[Dict[str, Callable[[Any], None]]] = {}
 
     @classmethod
-    async def init(cls, db_url: str, max_conn: int):
-        cls._engine = create_async_engine(db_url, echo=False, pool_size=max_conn)
+    async def init(
+        cls,
+        db_url: str,
+        settings: DatabaseSettings,
+        cache: Cache | None = None,
+        listen: bool = False,
+    ):
+        engine_options = settings.engine_options()
+        cls._engine = create_async_engine(db_url, **engine_options)
         cls._sessionmaker = async_sessionmaker(cls._engine, expire_on_commit=False)
+        instrument(cls._engine)
+        engines = [("primary", cls._engine)]
+        if settings.replica_urls:
+            cls._replicas = ReplicaSet(
+                cls._engine,
+                settings.replica_urls,
+                engine_options,
+                settings.replica_max_lag,
+            )
+            engines += [(r.name, r.engine) for r in cls._replicas.replicas]
+        if settings.slow_query_ms > 0:
+            cls._slow_logs = [
+                SlowQueryLog(
+                    engine,
+                    settings.slow_query_ms,
+                    settings.explain_sample,
+                    name=name,
+                )
+                for name, engine in engines
+            ]
+        POOL_CHECKEDOUT.set_function(cls._engine.pool.checkedout)
+        POOL_OVERFLOW.set_function(lambda: max(0, cls._engine.pool.overflow()))
+        # reads routed to a replica hold one of its connections, not a primary one
+        POOL_WAITERS.set_function(
+            lambda: max(
+                0,
+                DAO_INFLIGHT.value
+                - sum(engine.pool.checkedout() for _, engine in engines),
+            ),
+        )
+        cls._cache = cls._cache_backend = cache
+
+        if (cache is not None and listen) or settings.replica_urls:
+            # other workers' writes, and the pins of their writers, are only
+            # seen through the listener; the cache waits until it is up
+            cls._cache = None
+            cls._listener = ChangeListener(
+                cls._engine.url.set(drivername="postgresql").render_as_string(
+                    hide_password=False,
+                ),
+                on_change=cls._on_change,
+                on_down=cls._suspend_cache,
+                on_up=cls._resume_cache,
+            )
+            cls._listener.start()
+        if cls._replicas is not None:
+            await cls._replicas.start()
+            logger.info(
+                "[+] Routing reads to {} replicas;",
+                len(cls._replicas.replicas),
+            )
         """async with cls._engine.begin() as conn:
             await conn.execute(text(
                 "CREATE EXTENSION IF NOT EXISTS ltree;"
@@ -37,208 +321,739 @@ class Database:
             await conn.run_sync(Base.metadata.create_all)"""
         logger.info(
             "[+] Database engine initialized with max {} connections;",
-            max_conn,
+            settings.pool_size,
         )
         return cls._engine
 
+    @classmethod
+    async def warm_up(cls):
+        # Opens pool_size connections up front so the first requests after a
+        # deploy do not pay for connect, auth and asyncpg's type introspection
+        # of ltree/geography; closing returns them to the pool.
+        started = perf_counter()
+        engines = [cls._engine]
+        if cls._replicas is not None:
+            engines += [r.engine for r in cls._replicas.replicas if r.healthy]
+
+        conns = await asyncio.gather(
+            *(
+                engine.connect().start()
+                for engine in engines
+                for _ in range(engine.pool.size())
+            ),
+        )
+        warm = "SELECT NULL::ltree, NULL::geography"
+        await asyncio.gather(*(conn.exec_driver_sql(warm) for conn in conns))
+        for conn in conns:
+            await conn.close()
+        logger.info(
+            "[+] Pool warmed up, {} connections in {:.0f} ms;",
+            len(conns),
+            (perf_counter() - started) * 1000,
+        )
+
     @classmethod
     async def close(cls):
+        if cls._listener is not None:
+            await cls._listener.stop()
+            cls._listener = None
+        if cls._replicas is not None:
+            await cls._replicas.stop()
+            cls._replicas = None
         if cls._engine:
             await cls._engine.dispose()
             logger.info("[+] Database engine successfully closed;")
 
     @classmethod
-    async def get_organization_by_id(cls, org_id: int) -> OrgORM | None:
+    def cache_stats(cls) -> dict:
+        if cls._cache_backend is None:
+            return {}
+
+        stats = cls._cache_backend.stats()
+        stats["active"] = cls._cache is not None
+        stats["coalesced"] = shared_calls()
+        if cls._listener is not None:
+            stats["listener"] = cls._listener.stats()
+        return stats
+
+    @classmethod
+    def replica_stats(cls) -> List[dict]:
+        return cls._replicas.stats() if cls._replicas is not None else []
+
+    @classmethod
+    def slow_queries(cls, limit: int) -> List[dict]:
+        # slowest first across the primary and the replicas
+        entries = [entry for log in cls._slow_logs for entry in log.top(limit)]
+        entries.sort(key=lambda entry: entry["max_ms"], reverse=True)
+        return entries[:limit]
+
+    @classmethod
+    def _read_session(cls, cached: bool = False):
+        # Replica unless this client wrote within the pin window. Results that
+        # go into the cache also stay on the primary for a while after any
+        # write: a lagging replica would put the pre-write row back for TTL.
+        if cls._replicas is None or cls._pinned():
+            return cls._sessionmaker()
+        if cached and cls._cache is not None and monotonic() < cls._fence:
+            return cls._sessionmaker()
+
+        replica = cls._replicas.next(read_after())
+        return (replica.sessionmaker if replica else cls._sessionmaker)()
+
+    @classmethod
+    def _skip_cache(cls) -> bool:
+        # An entry may predate a write on another worker until its NOTIFY
+        # arrives: a client that wrote, here or with X-Read-After, gets fresh
+        # rows.
+        return read_after() is not None or cls._pinned()
+
+    @classmethod
+    def _pinned(cls) -> bool:
+        return cls._replicas is not None and cls._replicas.pinned(current_client.get())
+
+    @classmethod
+    def _wrote(cls, client: str | None):
+        if cls._replicas is not None:
+            cls._replicas.pin(client)
+            cls._fence = monotonic() + cls._replicas.window
+
+    @classmethod
+    async def _commit(cls, session, *tags: str):
+        # Commits a write and invalidates what it touched. The NOTIFY is sent in
+        # the write's own transaction: Postgres delivers it only on commit, so
+        # other workers hear of exactly the writes that happened.
+        client = current_client.get()
+        if cls._listener is not None:
+            # the writer's pin travels along, its next read may hit another worker
+            payload = change_payload(tags, client=client)
+            await session.execute(select(func.pg_notify(CHANNEL, payload)))
+        await session.commit()
+
+        reset_flights()
+        cls._wrote(client)
+        if cls._cache_backend is not None:
+            cls._cache_backend.invalidate(tags)
+
+        position = wal_position.get()
+        if cls._replicas is not None and position is not None:
+            # goes back to the client, whichever worker serves its next read;
+            # the write is committed already, so a failure must not fail it
+            try:
+                position.advance(int(await session.scalar(WRITE_LSN_SQL)))
+            except Exception as e:
+                logger.warning("[-] WAL position after write unavailable: {!r}", e)
+
+    @classmethod
+    def subscribe(cls, key: str, handler: Callable[[Any], None]):
+        # handler(event[key]) for events published by other workers
+        cls._subscribers[key] = handler
+
+    @classmethod
+    async def publish(cls, key: str, value: Any):
         async with cls._sessionmaker() as session:
+            payload = event_payload({key: value})
+            await session.execute(select(func.pg_notify(CHANNEL, payload)))
+            await session.commit()
+
+    @classmethod
+    def _on_change(cls, event: dict):
+        for key, handler in cls._subscribers.items():
+            if key in event:
+                handler(event[key])
+        if "tags" not in event and not event.get("flush"):
+            return
+
+        reset_flights()
+        cls._wrote(event.get("client"))
+        if event.get("flush"):
+            if cls._cache_backend is not None:
+                cls._cache_backend.clear()
+            cls._reload_activity_tree()
+        else:
+            if cls._cache_backend is not None:
+                cls._cache_backend.invalidate(event.get("tags", ()))
+            if ACTIVITIES_TAG in event.get("tags", ()):
+                cls._reload_activity_tree()
+
+    @classmethod
+    def _suspend_cache(cls):
+        logger.warning("[-] Change listener is down, read cache suspended;")
+        cls._cache = None
+
+    @classmethod
+    def _resume_cache(cls):
+        if cls._cache_backend is not None:
+            cls._cache_backend.clear()
+        cls._cache = cls._cache_backend
+        cls._reload_activity_tree()
+
+    @classmethod
+    @timed
+    async def load_activity_tree(cls) -> ActivityTree:
+        async with cls._sessionmaker() as session:
+            stmt = select(ActORM.id, ActORM.label, cast(ActORM.path, Text))
+            cls._tree = ActivityTree((await session.execute(stmt)).tuples())
+
+        logger.info("[+] Activity tree loaded, {} nodes;", len(cls._tree))
+        return cls._tree
+
+    @classmethod
+    def _reload_activity_tree(cls):
+        # called from listener callbacks, which cannot await
+        if cls._tree_task is None or cls._tree_task.done():
+            cls._tree_task = asyncio.create_task(cls.load_activity_tree())
+
+    @classmethod
+    def _live_tree(cls) -> ActivityTree | None:
+        # Activities created by other workers reach the snapshot only through
+        # the change listener. Without one, or while a reload is pending,
+        # subtree lookups go to SQL instead of missing the new nodes.
+        if cls._listener is None or not cls._listener.connected:
+            return None
+        if cls._tree_task is not None and not cls._tree_task.done():
+            return None
+        return cls._tree
+
+    @classmethod
+    async def activity_tree(cls) -> ActivityTree:
+        return cls._tree or await cls.load_activity_tree()
+
+    @classmethod
+    async def _activity_tags(cls, session, act_ids: Iterable[int]) -> List[str]:
+        act_ids = list(act_ids)
+        if cls._tree is not None and all(i in cls._tree.label for i in act_ids):
+            return [f"act:{label}" for label in cls._tree.ancestor_labels(act_ids)]
+
+        # org lists of every label at or above these activities in the tree
+        child, parent = aliased(ActORM), aliased(ActORM)
+        stmt = (
+            select(parent.label)
+            .distinct()
+            .join(child, child.path.descendant_of(parent.path))
+            .where(child.id.in_(list(act_ids)))
+        )
+        labels = (await session.execute(stmt)).scalars().all()
+        return [f"act:{label}" for label in labels]
+
+    @classmethod
+    @cached(org_entry_tags)
+    @coalesced
+    @timed
+    async def get_organization_by_id(
+        cls,
+        org_id: int,
+        fieldset: Fieldset = FULL,
+    ) -> OrgORM | None:
+        async with cls._read_session(cached=True) as session:
             stmt = (
                 select(OrgORM)
                 .where(OrgORM.id == org_id)
-                .options(selectinload(OrgORM.activities), joinedload(OrgORM.building))
+                .options(*org_options(fieldset))
             )
 
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def get_organizations_by_bid(cls, building_id: int) -> List[OrgORM] | None:
-        async with cls._sessionmaker() as session:
+    @cached(page_tags("bld:{building_id}"))
+    @coalesced
+    @timed
+    async def get_organizations_by_bid(
+        cls,
+        building_id: int,
+        page: PageParams,
+        as_json: bool = False,
+        fieldset: Fieldset = FULL,
+    ) -> Page[OrgORM] | Page[OrgDocument]:
+        async with cls._read_session(cached=True) as session:
+            if as_json:
+                return await cls._organizations_json(
+                    session,
+                    OrgORM.b_id == building_id,
+                    page,
+                    fieldset,
+                )
+
             stmt = (
                 select(OrgORM)
                 .where(OrgORM.b_id == building_id)
-                .options(selectinload(OrgORM.activities), joinedload(OrgORM.building))
+                .options(*org_options(fieldset))
             )
+            stmt = keyset(stmt, OrgORM.id, page)
 
             result = await session.execute(stmt)
-            return result.scalars().all() if result else None
+            return Page.from_rows(result.scalars().all(), page.limit, lambda o: [o.id])
 
     @classmethod
+    @cached(page_tags("act:{label}"))
+    @coalesced
+    @timed
     async def get_organizations_by_activity(
         cls,
         label: str,
+        page: PageParams,
         strict: bool = False,
-    ) -> List[OrgORM] | None:
-        async with cls._sessionmaker() as session:
-            if strict:
-                stmt = (
-                    select(OrgORM)
-                    .join(OrgORM.activities)
-                    .options(
-                        selectinload(OrgORM.activities),
-                        joinedload(OrgORM.building),
-                    )
-                    .where(ActORM.label == label)
+        as_json: bool = False,
+        fieldset: Fieldset = FULL,
+    ) -> Page[OrgORM] | Page[OrgDocument]:
+        async with cls._read_session(cached=True) as session:
+            if as_json:
+                return await cls._organizations_json(
+                    session,
+                    activity_filter(label, strict, cls._live_tree()),
+                    page,
+                    fieldset,
                 )
-            else:
-                parent_path = (
-                    await session.execute(
-                        select(ActORM.path).where(ActORM.label == label),
-                    )
-                ).scalar_one_or_none()
 
-                if parent_path is None:
-                    return None
+            # a semi-join: each organization appears once however many of its
+            # activities fall under `label`
+            stmt = (
+                select(OrgORM)
+                .where(activity_filter(label, strict, cls._live_tree()))
+                .options(*org_options(fieldset))
+            )
+            stmt = keyset(stmt, OrgORM.id, page)
 
-                allowed_act_ids = (
-                    (
-                        await session.execute(
-                            select(ActORM.id).where(
-                                ActORM.path.descendant_of(parent_path),
-                            ),
-                        )
-                    )
-                    .scalars()
-                    .all()
-                )
+            result = await session.execute(stmt)
+            return Page.from_rows(result.scalars().all(), page.limit, lambda o: [o.id])
 
-                stmt = (
-                    select(OrgORM)
-                    .join(OrgORM.activities)
-                    .options(
-                        selectinload(OrgORM.activities),
-                        joinedload(OrgORM.building),
-                    )
-                    .where(ActORM.id.in_(allowed_act_ids))
-                )
+    @classmethod
+    async def _organizations_json(
+        cls,
+        session,
+        condition,
+        page: PageParams,
+        fieldset: Fieldset = FULL,
+    ) -> Page[OrgDocument]:
+        stmt = select(
+            OrgORM.id,
+            OrgORM.b_id,
+            cast(organization_json(fieldset), Text),
+        ).where(condition)
+        if "building" in fieldset.expand:
+            stmt = stmt.join(BuildORM, BuildORM.id == OrgORM.b_id)
+        stmt = keyset(stmt, OrgORM.id, page)
 
-            result = await session.execute(stmt)
-            return result.scalars().all() if result else None
+        result = await session.execute(stmt)
+        docs = Page.from_rows(result.all(), page.limit, lambda r: [r[0]])
+        docs.items = [OrgDocument(*row) for row in docs.items]
+        return docs
 
     @classmethod
-    async def search_for_organizations(cls, query: str) -> List[OrgORM] | None:
-        async with cls._sessionmaker() as session:
+    @coalesced
+    @timed
+    async def search_for_organizations(
+        cls,
+        query: str,
+        page: PageParams,
+        fuzzy: bool = False,
+        min_score: float = 0.3,
+        fieldset: Fieldset = FULL,
+    ) -> Page[OrgORM]:
+        async with cls._read_session() as session:
+            score = func.similarity(OrgORM.title, query)
+
+            if fuzzy:
+                # `%` is the indexable form of similarity() >= threshold
+                await session.execute(
+                    select(
+                        func.set_config(
+                            "pg_trgm.similarity_threshold",
+                            str(min_score),
+                            True,
+                        ),
+                    ),
+                )
+                condition = OrgORM.title.op("%")(query)
+            else:
+                pattern = re.sub(r"([\\%_])", r"\\\1", query)
+                condition = OrgORM.title.ilike(f"%{pattern}%")
+
             stmt = (
-                select(OrgORM)
-                .where(OrgORM.title.ilike(f"%{query}%"))
-                .options(selectinload(OrgORM.activities), joinedload(OrgORM.building))
+                select(OrgORM, score)
+                .where(condition)
+                .options(*org_options(fieldset))
+                .order_by(score.desc(), OrgORM.id)
+                .limit(page.limit + 1)
             )
 
+            if page.after is not None:
+                last_score, last_id = decode_cursor(page.after, 2)
+                valid = isinstance(last_score, float | int) and isinstance(last_id, int)
+                if not valid:
+                    raise InvalidCursorError(page.after)
+                stmt = stmt.where(
+                    or_(
+                        score < last_score,
+                        and_(score == last_score, OrgORM.id > last_id),
+                    ),
+                )
+
             result = await session.execute(stmt)
-            return result.scalars().all() if result else None
+            orgs = Page.from_rows(result.all(), page.limit, lambda r: [r[1], r[0].id])
+            orgs.items = [org for org, _ in orgs.items]
+            return orgs
 
     @classmethod
+    @coalesced
+    @timed
     async def organizations_within_radius(
         cls,
-        lat: float,
-        lon: float,
+        point: GeoPoint,
         radius: float,
-    ) -> List[OrgORM] | None:
-        async with cls._sessionmaker() as session:
+        page: PageParams,
+        fieldset: Fieldset = FULL,
+    ) -> Page[OrgORM]:
+        async with cls._read_session() as session:
             stmt = (
                 select(OrgORM)
                 .join(BuildORM, BuildORM.id == OrgORM.b_id)
-                .options(joinedload(OrgORM.building), selectinload(OrgORM.activities))
-                .where(
-                    func.ST_DWithin(
-                        cast(
-                            func.ST_SetSRID(
-                                func.ST_MakePoint(BuildORM.lon, BuildORM.lat),
-                                4326,
-                            ),
-                            Geography,
-                        ),
-                        cast(
-                            func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326),
-                            Geography,
-                        ),
-                        radius,
-                    ),
-                )
-                .options(selectinload(OrgORM.activities))
+                .options(*org_options(fieldset, building_joined=True))
+                .where(func.ST_DWithin(BuildORM.geog, geo_point(*point), radius))
             )
+            stmt = keyset(stmt, OrgORM.id, page)
 
             result = await session.execute(stmt)
-
-            return result.scalars().all() if result else None
+            return Page.from_rows(result.scalars().all(), page.limit, lambda o: [o.id])
 
     @classmethod
+    @coalesced
+    @timed
     async def buildings_within_radius(
         cls,
-        lat: float,
-        lon: float,
+        point: GeoPoint,
         radius: float,
-    ) -> List[BuildORM] | None:
-        async with cls._sessionmaker() as session:
+        page: PageParams,
+    ) -> Page[BuildORM]:
+        async with cls._read_session() as session:
+            stmt = select(BuildORM).where(
+                func.ST_DWithin(BuildORM.geog, geo_point(*point), radius),
+            )
+            stmt = keyset(stmt, BuildORM.id, page)
+
+            result = await session.execute(stmt)
+            return Page.from_rows(result.scalars().all(), page.limit, lambda b: [b.id])
+
+    @classmethod
+    @coalesced
+    @timed
+    async def nearest_organizations(
+        cls,
+        point: GeoPoint,
+        k: int,
+        activity: str | None = None,
+        strict: bool = False,
+        fieldset: Fieldset = FULL,
+    ) -> List[Tuple[OrgORM, float]]:
+        async with cls._read_session() as session:
+            origin = geo_point(*point)
             stmt = (
-                select(BuildORM)
-                .where(
-                    func.ST_DWithin(
-                        cast(
-                            func.ST_SetSRID(
-                                func.ST_MakePoint(BuildORM.lon, BuildORM.lat),
-                                4326,
-                            ),
-                            Geography,
-                        ),
-                        cast(
-                            func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326),
-                            Geography,
-                        ),
-                        radius,
-                    ),
-                )
-                .options(selectinload(BuildORM.orgs))
+                select(OrgORM, func.ST_Distance(BuildORM.geog, origin))
+                .join(BuildORM, BuildORM.id == OrgORM.b_id)
+                .options(*org_options(fieldset, building_joined=True))
+                # <-> ordering with LIMIT is served by a KNN scan of ix_buildings_geog
+                .order_by(BuildORM.geog.op("<->")(origin), OrgORM.id)
+                .limit(k)
+            )
+            if activity is not None:
+                stmt = stmt.where(activity_filter(activity, strict, cls._live_tree()))
+
+            result = await session.execute(stmt)
+            return [(org, distance) for org, distance in result.all()]
+
+    @classmethod
+    @coalesced
+    @timed
+    async def nearest_buildings(
+        cls,
+        point: GeoPoint,
+        k: int,
+        activity: str | None = None,
+        strict: bool = False,
+    ) -> List[Tuple[BuildORM, float]]:
+        async with cls._read_session() as session:
+            origin = geo_point(*point)
+            stmt = (
+                select(BuildORM, func.ST_Distance(BuildORM.geog, origin))
+                .order_by(BuildORM.geog.op("<->")(origin), BuildORM.id)
+                .limit(k)
             )
+            if activity is not None:
+                orgs = select(OrgORM.id).where(
+                    OrgORM.b_id == BuildORM.id,
+                    activity_filter(activity, strict, cls._live_tree()),
+                )
+                stmt = stmt.where(orgs.exists())
 
             result = await session.execute(stmt)
+            return [(build, distance) for build, distance in result.all()]
+
+    @classmethod
+    async def stream_organizations(
+        cls,
+        batch: int = 500,
+    ) -> AsyncIterator[List[OrgORM]]:
+        # server-side cursor: one connection is held for the whole export and
+        # the next batch is fetched only after the consumer took this one
+        async with cls._read_session() as session:
+            stmt = (
+                select(OrgORM)
+                .order_by(OrgORM.id)
+                .options(selectinload(OrgORM.activities), joinedload(OrgORM.building))
+                .execution_options(yield_per=batch)
+            )
 
-            return result.scalars().all() if result else None
+            result = await session.stream_scalars(stmt)
+            async for orgs in result.partitions():
+                yield orgs
+                session.expunge_all()
 
     @classmethod
-    async def create_organization(cls, org_model: OrganizationIn) -> OrgORM:
+    @timed
+    async def bulk_create_organizations(
+        cls,
+        rows: List[Tuple[int, OrganizationIn]],
+    ) -> Tuple[List[int], List[Tuple[int, str]]]:
+        # one chunk of (row index, model) per transaction
+        pending, errors = unique_rows(rows, lambda org: org.title, "title")
+        if not pending:
+            return [], errors
+
         async with cls._sessionmaker() as session:
+            valid, invalid = await cls._check_org_refs(session, pending)
+            errors += invalid
+            if not valid:
+                return [], errors
+
             try:
-                org_obj = OrgORM(
-                    title=org_model.title,
-                    phone=org_model.phone,
-                    b_id=org_model.building_id,
+                stmt = (
+                    pg_insert(OrgORM)
+                    .on_conflict_do_nothing(index_elements=[OrgORM.title])
+                    .returning(OrgORM.id, OrgORM.title)
                 )
+                params = [
+                    {"title": org.title, "phone": org.phone, "b_id": org.building_id}
+                    for _, org in valid
+                ]
+                result = await session.execute(stmt, params)
+                inserted = {title: org_id for org_id, title in result.tuples()}
 
-                session.add(org_obj)
-                await session.commit()
-                await session.refresh(org_obj)
+                rels = [
+                    {"org_id": inserted[org.title], "act_id": act_id}
+                    for _, org in valid
+                    if org.title in inserted
+                    for act_id in set(org.activity_ids)
+                ]
+                if rels:
+                    await session.execute(insert(RelationshipAO), rels)
 
-                org_id = org_obj.id
+                await cls._commit(
+                    session,
+                    *(f"org:{org_id}" for org_id in inserted.values()),
+                    *(f"bld:{org.building_id}" for _, org in valid),
+                    *await cls._activity_tags(
+                        session,
+                        {act_id for _, org in valid for act_id in org.activity_ids},
+                    ),
+                )
+            except IntegrityError as e:
+                await session.rollback()
+                loader = cls.bulk_create_organizations
+                return await cls._retry_rows(loader, valid, e, errors)
 
-                rels = []
+            created = []
+            for index, org in valid:
+                if org.title in inserted:
+                    created.append(inserted[org.title])
+                else:
+                    errors.append((index, "title already exists"))
 
-                for act_id in org_model.activity_ids:
-                    rels.append(RelationshipAO(org_id=org_id, act_id=act_id))
+            return created, errors
 
-                session.add_all(rels)
+    @classmethod
+    @timed
+    async def bulk_create_buildings(
+        cls,
+        rows: List[Tuple[int, BuildingIn]],
+    ) -> Tuple[List[int], List[Tuple[int, str]]]:
+        pending, errors = unique_rows(rows, lambda build: build.addr, "addr")
+        if not pending:
+            return [], errors
 
-                await session.commit()
-                await session.refresh(
-                    org_obj,
-                    attribute_names=["building", "activities"],
+        async with cls._sessionmaker() as session:
+            try:
+                stmt = (
+                    pg_insert(BuildORM)
+                    .on_conflict_do_nothing(index_elements=[BuildORM.addr])
+                    .returning(BuildORM.id, BuildORM.addr)
                 )
+                params = [
+                    {"addr": build.addr, "lat": build.lat, "lon": build.lon}
+                    for _, build in pending
+                ]
+                result = await session.execute(stmt, params)
+                inserted = {addr: build_id for build_id, addr in result.tuples()}
 
-                return org_obj
-            except Exception as e:
+                # a title listed twice in the chunk goes to the last building
+                moves = {
+                    title: inserted[build.addr]
+                    for _, build in pending
+                    if build.addr in inserted
+                    for title in build.organizations or ()
+                }
+                moved = []
+                if moves:
+                    mapping = values(
+                        column("title", String),
+                        column("b_id", Integer),
+                        name="moves",
+                    ).data(list(moves.items()))
+                    stmt = (
+                        update(OrgORM)
+                        .where(OrgORM.title == mapping.c.title)
+                        .values(b_id=mapping.c.b_id)
+                        .returning(OrgORM.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    moved = (await session.execute(stmt)).scalars().all()
+
+                await cls._commit(
+                    session,
+                    *(f"bld:{build_id}" for build_id in inserted.values()),
+                    *(f"org:{org_id}" for org_id in moved),
+                )
+            except IntegrityError as e:
                 await session.rollback()
-                print(e, e.args, e.__traceback__)
-                raise e
+                loader = cls.bulk_create_buildings
+                return await cls._retry_rows(loader, pending, e, errors)
+
+            created = []
+            for index, build in pending:
+                if build.addr in inserted:
+                    created.append(inserted[build.addr])
+                else:
+                    errors.append((index, "addr already exists"))
+
+            return created, errors
 
     @classmethod
+    async def _check_org_refs(
+        cls,
+        session,
+        rows: List[Tuple[int, OrganizationIn]],
+    ) -> Tuple[List[Tuple[int, OrganizationIn]], List[Tuple[int, str]]]:
+        b_ids = {org.building_id for _, org in rows}
+        act_ids = {act_id for _, org in rows for act_id in org.activity_ids}
+
+        known_b = set(
+            (await session.execute(select(BuildORM.id).where(BuildORM.id.in_(b_ids))))
+            .scalars()
+            .all(),
+        )
+        known_a = set(
+            (await session.execute(select(ActORM.id).where(ActORM.id.in_(act_ids))))
+            .scalars()
+            .all(),
+        )
+
+        valid, errors = [], []
+        for index, org in rows:
+            missing = set(org.activity_ids) - known_a
+            if org.building_id not in known_b:
+                errors.append((index, f"unknown building_id {org.building_id}"))
+            elif missing:
+                errors.append((index, f"unknown activity_ids {sorted(missing)}"))
+            else:
+                valid.append((index, org))
+
+        return valid, errors
+
+    @classmethod
+    async def _retry_rows(cls, loader, rows, exc: Exception, errors):
+        # the chunk hit a constraint the pre-checks could not see (e.g. a
+        # concurrent delete): retry row by row so the error lands on its row
+        if len(rows) == 1:
+            return [], [*errors, (rows[0][0], exc.__class__.__name__)]
+
+        ids: List[int] = []
+        for row in rows:
+            row_ids, row_errors = await loader([row])
+            ids += row_ids
+            errors += row_errors
+        return ids, errors
+
+    @classmethod
+    @timed
+    async def create_organization(cls, org_model: OrganizationIn) -> OrganizationOut:
+        # one statement: the org, its rel_ao rows and the response document
+        # come back together, and a failure anywhere leaves nothing behind
+        act_ids = sorted(set(org_model.activity_ids))
+
+        new_org = (
+            insert(OrgORM)
+            .values(
+                title=org_model.title,
+                phone=org_model.phone,
+                b_id=org_model.building_id,
+            )
+            .returning(OrgORM.id, OrgORM.title, OrgORM.phone, OrgORM.b_id)
+            .cte("new_org")
+        )
+        new_rels = (
+            insert(RelationshipAO)
+            .from_select(
+                ["org_id", "act_id"],
+                select(
+                    new_org.c.id,
+                    func.unnest(cast(act_ids, ARRAY(Integer))),
+                ),
+            )
+            .returning(RelationshipAO.org_id, RelationshipAO.act_id)
+            .cte("new_rels")
+        )
+
+        child, parent = aliased(ActORM), aliased(ActORM)
+        labels = (
+            select(func.array_agg(parent.label.distinct()))
+            .select_from(child)
+            .join(new_rels, new_rels.c.act_id == child.id)
+            .join(parent, child.path.descendant_of(parent.path))
+            .scalar_subquery()
+        )
+        doc = func.json_build_object(
+            "id",
+            new_org.c.id,
+            "title",
+            new_org.c.title,
+            "phone",
+            new_org.c.phone,
+            "building",
+            building_json(),
+            "activities",
+            activities_json(new_org.c.id, new_rels),
+        )
+        stmt = (
+            select(cast(doc, Text), labels)
+            .select_from(new_org)
+            .join(BuildORM, BuildORM.id == new_org.c.b_id)
+        )
+
+        async with cls._sessionmaker() as session:
+            try:
+                doc, labels = (await session.execute(stmt)).one()
+                await cls._commit(
+                    session,
+                    *org_tags(doc),
+                    *(f"act:{label}" for label in labels or ()),
+                )
+            except Exception:
+                await session.rollback()
+                raise
+
+            return OrganizationOut.model_validate_json(doc)
+
+    @classmethod
+    @timed
     async def create_building(cls, b_model: BuildingIn) -> BuildORM:
         async with cls._sessionmaker() as session:
             try:
@@ -258,10 +1073,15 @@ class Database:
                     update(OrgORM)
                     .where(OrgORM.title.in_(b_model.organizations))
                     .values(b_id=build_id)
+                    .returning(OrgORM.id)
                 )
 
-                await session.execute(stmt)
-                await session.commit()
+                moved = (await session.execute(stmt)).scalars().all()
+                await cls._commit(
+                    session,
+                    f"bld:{build_id}",
+                    *(f"org:{i}" for i in moved),
+                )
                 await session.refresh(build_obj, attribute_names=["orgs"])
 
                 return build_obj
@@ -270,78 +1090,95 @@ class Database:
                 raise e
 
     @classmethod
-    async def create_activity(cls, act_mod: ActivityIn) -> ActORM:
-        async with cls._sessionmaker() as session:
-            try:
-                parent = None
+    @timed
+    async def create_activity(cls, act_mod: ActivityIn) -> ActORM | None:
+        return (await cls.create_activities([act_mod.labels]))[0]
 
-                for raw_label in act_mod.labels:
-                    vertice = raw_label.translate(translit_table)
-
-                    if parent is None:
-                        stmt = select(ActORM).where(
-                            ActORM.label == raw_label,
-                            func.nlevel(ActORM.path) == 1,
-                        )
+    @classmethod
+    @timed
+    async def create_activities(
+        cls,
+        chains: List[List[str]],
+    ) -> List[ActORM | None]:
+        # every prefix of every chain, parents before children:
+        # ["A", "B"] -> {"A": "A", "A.B": "B"} (path -> label)
+        wanted: dict[str, str] = {}
+        for chain in chains:
+            path = []
+            for label in chain:
+                path.append(to_ltree_label(label))
+                wanted.setdefault(".".join(path), label)
 
-                        result = await session.execute(stmt)
+        if not wanted:
+            return [None for _ in chains]
 
-                        node = result.scalars().all()
-                        node = list(
-                            filter(
-                                lambda x: len(parent.path) + 1 == len(x.path),
-                                result,
-                            ),
-                        )
-                    else:
-                        stmt = select(ActORM).where(
-                            ActORM.label == raw_label,
-                            ActORM.path.descendant_of(parent.path),
-                        )
+        async with cls._sessionmaker() as session:
+            try:
+                nodes = await cls._activities_by_path(session, wanted)
 
-                        result = await session.execute(stmt)
+                missing = [
+                    {"label": label, "path": Ltree(path)}
+                    for path, label in wanted.items()
+                    if path not in nodes
+                ]
+                if missing:
+                    stmt = (
+                        pg_insert(ActORM)
+                        .on_conflict_do_nothing(index_elements=[ActORM.path])
+                        .returning(ActORM)
+                    )
+                    created = (await session.scalars(stmt, missing)).all()
+                    nodes.update((str(node.path), node) for node in created)
 
-                        node = result.scalar_one_or_none()
+                    # lost a race for some paths, pick up the winner's rows
+                    if len(nodes) < len(wanted):
+                        nodes.update(await cls._activities_by_path(session, wanted))
 
-                    if not node:
-                        node = ActORM(label=raw_label)
-                        if parent is None:
-                            node.path = Ltree(vertice)
-                        else:
-                            node.path = Ltree(f"{parent.path}.{vertice}")
-                        session.add(node)
-                        await session.flush()
-                    parent = node
-                await session.commit()
-                return parent
+                await cls._commit(session, *([ACTIVITIES_TAG] if missing else []))
             except Exception as e:
                 await session.rollback()
                 logger.exception(
-                    "Catched exc {} in create_activity, probably IntegrityError", e
+                    "Catched exc {} in create_activities, probably IntegrityError", e
                 )
                 raise e
 
+            if missing:
+                await cls.load_activity_tree()
+
+        return [
+            nodes[".".join(map(to_ltree_label, chain))] if chain else None
+            for chain in chains
+        ]
+
+    @classmethod
+    async def _activities_by_path(cls, session, paths: Iterable[str]) -> dict:
+        stmt = select(ActORM).where(ActORM.path.in_([Ltree(p) for p in paths]))
+        return {str(node.path): node for node in await session.scalars(stmt)}
+
     @classmethod
+    @timed
     async def delete_organization(cls, org_mod: OrganizationDelete):
         async with cls._sessionmaker() as session:
             try:
                 await session.delete(await session.get(OrgORM, org_mod.id))
-                await session.commit()
+                await cls._commit(session, f"org:{org_mod.id}")
                 return True
             except Exception:
                 return False
 
     @classmethod
+    @timed
     async def delete_building(cls, build_mod: BuildingDelete):
         async with cls._sessionmaker() as session:
             try:
                 await session.delete(await session.get(BuildORM, build_mod.id))
-                await session.commit()
+                await cls._commit(session, f"bld:{build_mod.id}")
                 return True
             except Exception:
                 return False
 
     @classmethod
+    @timed
     async def update_organization(cls, org_mod: OrganizationUpdate):
         async with cls._sessionmaker() as session:
             org_obj = (
@@ -355,6 +1192,8 @@ class Database:
             if org_obj is None:
                 raise IndexError("id is invalid")
 
+            old_b_id = org_obj.b_id
+
             for k, v in org_mod.model_dump().items():
                 if k in ("activity_ids", "id") or v is None:
                     continue
@@ -391,13 +1230,23 @@ class Database:
                 await session.flush()
 
                 session.add_all(to_add_obj)
+                act_ids = new_ids
+            else:
+                act_ids = {act_obj.id for act_obj in org_obj.activities}
 
-            await session.commit()
+            # lists it left are tagged org:<id>; lists it joined by building/label
+            await cls._commit(
+                session,
+                *org_tags(org_obj),
+                f"bld:{old_b_id}",
+                *await cls._activity_tags(session, act_ids),
+            )
             await session.refresh(org_obj, attribute_names=["building", "activities"])
 
             return org_obj
 
     @classmethod
+    @timed
     async def update_building(cls, build_mod: BuildingUpdate):
         async with cls._sessionmaker() as session:
             build_obj = await session.get(BuildORM, build_mod.id)
@@ -409,7 +1258,7 @@ class Database:
                     continue
                 setattr(build_obj, k, v)
 
-            await session.commit()
+            await cls._commit(session, f"bld:{build_obj.id}")
             await session.refresh(build_obj, attribute_names=["orgs"])
 
             return build_obj
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from alembic.config import Config as AlembicConfig
+from sqlalchemy.engine import URL
+
+from alembic import command
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Any constant shared by all workers: pg_advisory_lock key of the schema setup
+SCHEMA_LOCK = 7_203_114
+
+
+def _alembic_config(url: URL) -> AlembicConfig:
+    # Built in code rather than from alembic.ini: with a config file env.py
+    # would run logging.fileConfig and mute the app's loggers. env.py imports
+    # src.*, so the repository root goes on sys.path whatever the cwd. The url
+    # goes through attributes, not the ini options: those would %-interpolate
+    # the password.
+    cfg = AlembicConfig()
+    cfg.set_main_option("script_location", str(ROOT / "src" / "alembic"))
+    cfg.set_main_option("prepend_sys_path", str(ROOT))
+    cfg.attributes["url"] = url.set(drivername="postgresql+psycopg2")
+    return cfg
+
+
+def upgrade_head(url: URL):
+    command.upgrade(_alembic_config(url), "head")
+
+
+def stamp_head(url: URL):
+    # a schema created from the models already has every migration applied
+    command.stamp(_alembic_config(url), "head")
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Annotated, List, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 from sqlalchemy_utils import Ltree
@@ -38,6 +38,13 @@ class ActivityOut(BaseModel):
         return value
 
 
+class ActivityNodeOut(BaseModel):
+    id: int = Field(description="ID деятельности")
+    label: str = Field(description="Наименование деятельности")
+    path: str = Field(description="Путь до деятельности в базе данных")
+    children: List["ActivityNodeOut"] = Field(description="Дочерние деятельности")
+
+
 class OrganizationOut(BaseModel):
     model_config = ConfigDict(from_attributes=True, exclude_none=True)
 
@@ -51,6 +58,28 @@ class OrganizationOut(BaseModel):
     )
 
 
+class OrganizationNearOut(OrganizationOut):
+    distance: float = Field(description="Расстояние до точки в метрах")
+
+
+class BuildingNearOut(BuildingOut):
+    distance: float = Field(description="Расстояние до точки в метрах")
+
+
+class BulkRowError(BaseModel):
+    index: int = Field(description="Номер строки во входных данных (с 0)")
+    error: str = Field(description="Причина, по которой строка не создана")
+
+
+class BulkResult(BaseModel):
+    received: int = Field(description="Получено строк")
+    created: List[int] = Field(description="ID созданных объектов")
+    failed: int = Field(description="Строк с ошибками")
+    elapsed: float = Field(description="Время загрузки в секундах")
+    rows_per_sec: float = Field(description="Скорость загрузки, строк в секунду")
+    errors: List[BulkRowError] = Field(description="Ошибки по строкам")
+
+
 # ---------------------- INPUT
 
 
@@ -78,6 +107,16 @@ class ActivityIn(BaseModel):
     )
 
 
+class ActivitiesIn(BaseModel):
+    chains: list[Annotated[list[str], Field(min_length=1)]] = Field(
+        description=(
+            "Пути до создаваемых деятельностей, недостающие предки создаются"
+            " вместе с ними"
+        ),
+        examples=[[["Еда", "Молочная продукция"], ["Автомобили", "Грузовые"]]],
+    )
+
+
 class OrganizationIn(BaseModel):
     title: str = Field(description="Название организации", examples=["ООО 'Тмыв'"])
     phone: list[str] = Field(
@@ -138,3 +177,6 @@ class BuildingDelete(BaseModel):
 OrganizationOut.model_rebuild()
 ActivityOut.model_rebuild()
 BuildingOut.model_rebuild()
+OrganizationNearOut.model_rebuild()
+BuildingNearOut.model_rebuild()
+ActivityNodeOut.model_rebuild()
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable
+
+import asyncpg
+from loguru import logger
+
+CHANNEL = "cache_invalidation"
+
+# NOTIFY payloads must stay under 8000 bytes; bigger changes flush everything
+PAYLOAD_LIMIT = 7900
+
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def event_payload(fields: Dict[str, Any]) -> str:
+    return json.dumps(
+        {"origin": WORKER_ID, "ts": time.time(), **fields},
+        ensure_ascii=False,
+    )
+
+
+def change_payload(tags: Iterable[str], client: str | None = None) -> str:
+    payload = event_payload({"tags": list(tags), "client": client})
+    if len(payload.encode()) > PAYLOAD_LIMIT:
+        payload = event_payload({"flush": True, "client": client})
+    return payload
+
+
+class ChangeListener:
+    # Dedicated LISTEN connection. While it is down nothing guarantees the cache
+    # is fresh, so on_down/on_up let the owner stop serving and start clean.
+    def __init__(
+        self,
+        dsn: str,
+        on_change: Callable[[Dict[str, Any]], None],
+        on_down: Callable[[], None],
+        on_up: Callable[[], None],
+        health_interval: float = 5.0,
+    ):
+        self.dsn = dsn
+        self.on_change = on_change
+        self.on_down = on_down
+        self.on_up = on_up
+        self.health_interval = health_interval
+
+        self.connected = False
+        self.events = 0
+        self.reconnects = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        self._task: asyncio.Task | None = None
+        self._backoff = 0.5
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "events": self.events,
+            "reconnects": self.reconnects,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("[-] Malformed change event: {}", payload)
+            return
+
+        if event.get("origin") == WORKER_ID:
+            return
+
+        # wall clocks of different hosts: only meaningful with synced clocks
+        lag = max(0.0, time.time() - event.get("ts", time.time()))
+        self.events += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+        self.on_change(event)
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                await self._listen(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[-] Change listener dropped: {!r}", e)
+            finally:
+                if self.connected:
+                    self.connected = False
+                    self.on_down()
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+
+            self.reconnects += 1
+            await asyncio.sleep(self._backoff)
+            self._backoff = min(self._backoff * 2, 30.0)
+
+    async def _listen(self, conn: asyncpg.Connection):
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _conn: lost.set())
+        await conn.add_listener(CHANNEL, self._on_notify)
+
+        self.connected = True
+        self._backoff = 0.5
+        self.on_up()
+        logger.info("[+] Listening for cache invalidations on {};", CHANNEL)
+
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), self.health_interval)
+            except TimeoutError:
+                await conn.fetchval("SELECT 1", timeout=self.health_interval)
@@ -1,6 +1,7 @@
 from typing import List
 
-from sqlalchemy import ForeignKey, Sequence, String
+from geoalchemy2 import Geography, WKBElement
+from sqlalchemy import Computed, ForeignKey, Index, Sequence, String
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.ext.mutable import MutableList
@@ -23,6 +24,7 @@ class RelationshipAO(Base):
     act_id: Mapped[int] = mapped_column(
         ForeignKey("activities.id", ondelete="CASCADE"),
         primary_key=True,
+        index=True,
     )
 
 
@@ -30,11 +32,18 @@ class ActORM(Base):
     __tablename__ = "activities"
     __table_args__ = (
         CheckConstraint("nlevel(path) <= 3", name="ck_activity_path_nlevel"),
+        # btree on path only serves equality, <@ / @> need GiST
+        Index("ix_activities_path_gist", "path", postgresql_using="gist"),
     )
 
     id: Mapped[int] = mapped_column(Sequence("activities_id_seq"), primary_key=True)
-    label: Mapped[str] = mapped_column(nullable=False)
-    path: Mapped[Ltree] = mapped_column(LtreeType, nullable=False, index=True)
+    label: Mapped[str] = mapped_column(nullable=False, index=True)
+    path: Mapped[Ltree] = mapped_column(
+        LtreeType,
+        nullable=False,
+        index=True,
+        unique=True,
+    )
 
     orgs: Mapped[List["OrgORM"]] = relationship(
         secondary="rel_ao",
@@ -44,11 +53,18 @@ class ActORM(Base):
 
 class BuildORM(Base):
     __tablename__ = "buildings"
+    __table_args__ = (Index("ix_buildings_geog", "geog", postgresql_using="gist"),)
 
     id: Mapped[int] = mapped_column(Sequence("buildings_id_seq"), primary_key=True)
     addr: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     lat: Mapped[float] = mapped_column(nullable=False)
     lon: Mapped[float] = mapped_column(nullable=False)
+    # kept in sync with lat/lon by Postgres, served by the GiST index above
+    geog: Mapped[WKBElement] = mapped_column(
+        Geography(geometry_type="POINT", srid=4326, spatial_index=False),
+        Computed("ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography", persisted=True),
+        deferred=True,
+    )
 
     orgs: Mapped[List["OrgORM"]] = relationship(
         back_populates="building",
@@ -58,6 +74,15 @@ class BuildORM(Base):
 
 class OrgORM(Base):
     __tablename__ = "organizations"
+    __table_args__ = (
+        Index("ix_organizations_b_id_id", "b_id", "id"),
+        Index(
+            "ix_organizations_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Sequence("organizations_id_seq"), primary_key=True)
     title: Mapped[str] = mapped_column(unique=True, nullable=False)
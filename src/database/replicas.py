@@ -0,0 +1,276 @@
+import asyncio
+import contextlib
+from collections import deque
+from contextvars import ContextVar
+from itertools import cycle
+from time import monotonic
+from typing import Any, Deque, Dict, List, Tuple
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from starlette.datastructures import Headers
+
+from utils.query_stats import instrument
+
+# Who is asking: the API token's jti, set by the auth dependency.
+current_client: ContextVar[str | None] = ContextVar("current_client", default=None)
+
+PINS_PRUNE_AT = 10_000
+
+READ_AFTER_HEADER = "X-Read-After"
+
+
+class WalPosition:
+    # Per request: the primary's WAL position the client has seen, raised by
+    # the request's own writes
+    def __init__(self, lsn: int | None):
+        self.lsn = lsn
+        self.advanced = False
+
+    def advance(self, lsn: int):
+        if self.lsn is None or lsn > self.lsn:
+            self.lsn = lsn
+        self.advanced = True
+
+
+wal_position: ContextVar[WalPosition | None] = ContextVar("wal_position", default=None)
+
+
+def read_after() -> int | None:
+    position = wal_position.get()
+    return position.lsn if position is not None else None
+
+
+def parse_lsn(value: str | None) -> int | None:
+    # pg_lsn text form, e.g. 0/16B3748; anything else is ignored
+    try:
+        high, low = value.split("/")
+        return int(high, 16) << 32 | int(low, 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_lsn(lsn: int) -> str:
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+# WAL positions as byte offsets. The primary's flush position is what standbys
+# can have received; a standby reports how far it replayed and whether its WAL
+# receiver streams (no row while the receiver is not running, NULL status for
+# roles without pg_read_all_stats).
+WRITE_LSN_SQL = text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")
+PRIMARY_LSN_SQL = text("SELECT pg_current_wal_flush_lsn() - '0/0'::pg_lsn")
+REPLICA_LSN_SQL = text(
+    "SELECT pg_last_wal_replay_lsn() - '0/0'::pg_lsn,"
+    " (SELECT coalesce(status, 'unknown') FROM pg_stat_wal_receiver)",
+)
+
+
+class Replica:
+    def __init__(self, url: str, engine_options: Dict[str, Any]):
+        self.engine = create_async_engine(url, **engine_options)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.name = f"{self.engine.url.host}:{self.engine.url.port or 5432}"
+        self.healthy = False
+        self.lag: float | None = None
+        self.replayed: int | None = None  # as of the last check
+        self.receiver: str | None = None
+        self.failures = 0
+        instrument(self.engine)
+
+
+class ReplicaSet:
+    # Replicas lagging more than max_lag, failing the check or not streaming
+    # get no reads. A client that wrote is pinned to the primary for max_lag
+    # plus one check interval: the longest a replica still serving can be
+    # behind its write.
+    #
+    # Lag is measured against the primary: every check first records its WAL
+    # position, a replica's lag is how long ago the primary was where the
+    # replica has replayed to (interpolated between checks). A receive/replay
+    # comparison on the replica alone reads 0 once it stops receiving.
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        urls: List[str],
+        engine_options: Dict[str, Any],
+        max_lag: float,
+        interval: float = 2.0,
+    ):
+        self.primary = primary
+        self.replicas = [Replica(url, engine_options) for url in urls]
+        self.max_lag = max_lag
+        self.interval = interval
+        self.window = max_lag + interval
+
+        self._order = cycle(self.replicas)
+        self._pins: Dict[str, float] = {}
+        # (monotonic time, primary WAL position), one per check, oldest first
+        self._marks: Deque[Tuple[float, int]] = deque()
+        self._primary_ok = True
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        await self._check_all()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def next(self, after: int | None = None) -> Replica | None:
+        # Round robin over the healthy ones that replayed up to `after` by their
+        # last check, None sends the read to the primary.
+        for _ in self.replicas:
+            replica = next(self._order)
+            if replica.healthy and (after is None or replica.replayed >= after):
+                return replica
+        return None
+
+    def pin(self, client: str | None):
+        if client is None:
+            return
+        now = monotonic()
+        if len(self._pins) > PINS_PRUNE_AT:
+            self._pins = {c: until for c, until in self._pins.items() if until > now}
+        self._pins[client] = now + self.window
+
+    def pinned(self, client: str | None) -> bool:
+        return client is not None and self._pins.get(client, 0.0) > monotonic()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "replica": replica.name,
+                "healthy": replica.healthy,
+                "lag": replica.lag,
+                "receiver": replica.receiver,
+                "failures": replica.failures,
+                "checkedout": replica.engine.pool.checkedout(),
+            }
+            for replica in self.replicas
+        ]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._check_all()
+
+    async def _check_all(self):
+        await self._mark_primary()
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _mark_primary(self):
+        # Without a fresh mark lags keep growing from the last one: replicas
+        # drop out after max_lag rather than serve reads nobody can date.
+        try:
+            async with self.primary.connect() as conn:
+                lsn = await asyncio.wait_for(
+                    conn.scalar(PRIMARY_LSN_SQL),
+                    self.interval,
+                )
+        except Exception as e:
+            if self._primary_ok:
+                logger.warning("[-] Primary WAL position check failed: {!r}", e)
+            self._primary_ok = False
+            return
+
+        now = monotonic()
+        self._primary_ok = True
+        self._marks.append((now, int(lsn)))
+        # one mark older than the window is kept to interpolate against
+        horizon = now - self.window
+        while len(self._marks) > 1 and self._marks[1][0] < horizon:
+            self._marks.popleft()
+
+    def _lag(self, replayed: int) -> float | None:
+        # None: behind every mark kept, i.e. more than window behind (or the
+        # replica is further behind than the first check after start)
+        if not self._marks or replayed < self._marks[0][1]:
+            return None
+
+        now = monotonic()
+        newer = None
+        for at, lsn in reversed(self._marks):
+            if replayed >= lsn:
+                if newer is None:
+                    return now - at
+                # between this mark and the next: assume WAL grew evenly
+                reached = at + (newer[0] - at) * (replayed - lsn) / (newer[1] - lsn)
+                return now - reached
+            newer = (at, lsn)
+        return None
+
+    async def _check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as conn:
+                row = (
+                    await asyncio.wait_for(
+                        conn.execute(REPLICA_LSN_SQL),
+                        self.interval,
+                    )
+                ).one()
+            replayed, replica.receiver = row
+            # NULL replay position: not a standby
+            replica.replayed = None if replayed is None else int(replayed)
+            replica.lag = None if replayed is None else self._lag(replica.replayed)
+            healthy = (
+                replica.receiver in {"streaming", "unknown"}
+                and replica.lag is not None
+                and replica.lag <= self.max_lag
+            )
+        except Exception as e:
+            replica.failures += 1
+            replica.lag = replica.replayed = replica.receiver = None
+            healthy = False
+            if replica.healthy:
+                logger.warning("[-] Replica {} check failed: {!r}", replica.name, e)
+
+        if healthy and not replica.healthy:
+            logger.info("[+] Replica {} is up, lag {};", replica.name, replica.lag)
+        elif replica.healthy and not healthy:
+            logger.warning(
+                "[-] Replica {} is down, lag {}, receiver {};",
+                replica.name,
+                replica.lag,
+                replica.receiver,
+            )
+        replica.healthy = healthy
+
+
+class ReadAfterMiddleware:
+    # Read-your-writes across workers: a response to a write carries the
+    # primary's WAL position after it in X-Read-After. A client sending it back
+    # is read from replicas that replayed that far, or from the primary.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        position = WalPosition(parse_lsn(Headers(scope=scope).get(READ_AFTER_HEADER)))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and position.advanced:
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (
+                        READ_AFTER_HEADER.lower().encode(),
+                        format_lsn(position.lsn).encode(),
+                    ),
+                ]
+            await send(message)
+
+        token = wal_position.set(position)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            wal_position.reset(token)
@@ -0,0 +1,69 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from config import _Config
+
+
+def unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4().hex}__"
+
+
+@dataclass
+class DatabaseSettings:
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pre_ping: bool = False
+    pool_recycle: int = -1
+    statement_cache_size: int = 100
+    server_settings: Dict[str, str] = field(default_factory=dict)
+    replica_urls: List[str] = field(default_factory=list)
+    replica_max_lag: float = 2.0
+    slow_query_ms: float = 0
+    explain_sample: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: _Config) -> "DatabaseSettings":
+        return cls(
+            pool_size=config.DB_MAXCON,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pre_ping=config.DB_PRE_PING,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            statement_cache_size=config.DB_STATEMENT_CACHE,
+            server_settings={
+                "application_name": config.DB_APP_NAME,
+                "jit": "on" if config.DB_JIT else "off",
+                "statement_timeout": str(config.DB_STATEMENT_TIMEOUT),
+            },
+            replica_urls=config.DB_REPLICA_URLS,
+            replica_max_lag=config.REPLICA_MAX_LAG,
+            slow_query_ms=config.SLOW_QUERY_MS,
+            explain_sample=config.SLOW_QUERY_EXPLAIN,
+        )
+
+    def engine_options(self) -> Dict[str, Any]:
+        # create_async_engine keywords, shared by the primary and the replicas
+        connect_args = {
+            # asyncpg's own cache and the one SQLAlchemy's adapter keeps on top
+            # of it, both per connection
+            "statement_cache_size": self.statement_cache_size,
+            "prepared_statement_cache_size": self.statement_cache_size,
+            # applied once per connection, in the startup packet
+            "server_settings": self.server_settings,
+        }
+        if not self.statement_cache_size:
+            # every statement is still prepared: behind a transaction-mode
+            # PgBouncer the default numbered names collide across backends
+            connect_args["prepared_statement_name_func"] = unique_statement_name
+
+        return {
+            "echo": False,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_pre_ping": self.pre_ping,
+            "pool_recycle": self.pool_recycle,
+            "connect_args": connect_args,
+        }
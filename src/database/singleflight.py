@@ -0,0 +1,63 @@
+import asyncio
+import inspect
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from database.cache import call_arguments
+from database.replicas import read_after
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+
+        # a cancelled caller must not cancel the query other callers wait on
+        return await asyncio.shield(task)
+
+    def reset(self):
+        # queries already running keep their waiters, new callers start fresh
+        self._calls.clear()
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+_flights = SingleFlight()
+
+
+# Concurrent identical calls of a Database read classmethod share one query;
+# keyed on the method, its normalized arguments, whether the caller is pinned
+# to the primary and the WAL position it read after (it must not join a read
+# running on a replica that may be behind its write).
+def coalesced(func):
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    async def wrapper(cls, *args, **kwargs):
+        arguments = call_arguments(signature, (cls, *args), kwargs)
+        key = (func.__qualname__, cls._pinned(), read_after(), *arguments.items())
+        return await _flights.do(key, lambda: func(cls, *args, **kwargs))
+
+    return wrapper
+
+
+def shared_calls() -> int:
+    return _flights.shared
+
+
+# After a write, joining a query that started before it could return data
+# older than the write to a client that has already seen it succeed.
+def reset_flights():
+    _flights.reset()
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, Sequence
+
+from loguru import logger
+from sqlalchemy import event
+
+SKIP_OPTION = "skip_slow_log"
+
+_PARAM = re.compile(r"\$\d+(?:::(?:DOUBLE PRECISION|\w+)(?:\[\])?)?")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    sql = _PARAM.sub("?", statement)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("?, ...", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def redact(parameters: Any) -> Any:
+    # keep types and sizes, never values: titles and phones are user data
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if parameters is None or isinstance(parameters, bool):
+        return parameters
+    if isinstance(parameters, (str, bytes)):
+        return f"<{type(parameters).__name__}:{len(parameters)}>"
+    return f"<{type(parameters).__name__}>"
+
+
+class SlowQueryLog:
+    # Statements slower than threshold_ms are logged and aggregated per
+    # fingerprint. A sample of SELECTs also gets a plain EXPLAIN (FORMAT JSON)
+    # on its own connection: no ANALYZE, that would run the query twice.
+    # One per engine, so the plan comes from the server that ran the query.
+    def __init__(
+        self,
+        engine,
+        threshold_ms: float,
+        explain_sample: float,
+        explain_every: float = 60.0,
+        name: str = "primary",
+    ):
+        self.engine = engine
+        self.name = name
+        self.threshold = threshold_ms / 1000
+        self.explain_sample = explain_sample
+        self.explain_every = explain_every
+
+        self.fingerprints: Dict[str, Dict[str, Any]] = {}
+        self._explained_at: Dict[str, float] = {}
+        self._explaining = False
+        self._tasks: set[asyncio.Task] = set()
+
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after)
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        entries = sorted(
+            self.fingerprints.values(),
+            key=lambda entry: entry["max_ms"],
+            reverse=True,
+        )
+        return [
+            {**entry, "mean_ms": round(entry["total_ms"] / entry["count"], 3)}
+            for entry in entries[:limit]
+        ]
+
+    def _before(self, _conn, _cursor, _statement, _params, context, _executemany):
+        context._slow_log_started = perf_counter()
+
+    def _after(self, _conn, _cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - context._slow_log_started
+        if elapsed < self.threshold or context.execution_options.get(SKIP_OPTION):
+            return
+
+        normalized = normalize(statement)
+        fp = fingerprint(normalized)
+        ms = round(elapsed * 1000, 3)
+
+        entry = self.fingerprints.setdefault(
+            fp,
+            {
+                "fingerprint": fp,
+                "engine": self.name,
+                "sql": normalized,
+                "count": 0,
+                "total_ms": 0.0,
+            },
+        )
+        entry["count"] += 1
+        entry["total_ms"] = round(entry["total_ms"] + ms, 3)
+        entry["max_ms"] = max(entry.get("max_ms", 0.0), ms)
+
+        # statement and plan go in the message too: no sink prints the extras
+        params = redact(parameters)
+        logger.bind(
+            kind="slow_query",
+            fingerprint=fp,
+            engine=self.name,
+            duration_ms=ms,
+            sql=normalized,
+            params=params,
+        ).warning(
+            "[-] Slow query {} took {} ms on {}: {} params {};",
+            fp,
+            ms,
+            self.name,
+            normalized,
+            params,
+        )
+
+        if not executemany and self._should_explain(fp, normalized):
+            # one at a time, so a burst of slow queries cannot drain the pool
+            self._explaining = True
+            self._explained_at[fp] = monotonic()
+            task = asyncio.get_running_loop().create_task(
+                self._explain(fp, statement, parameters),
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _should_explain(self, fp: str, normalized: str) -> bool:
+        # plain EXPLAIN does not execute, so a CTE hiding an INSERT is harmless
+        if self._explaining or not normalized.upper().startswith(("SELECT", "WITH")):
+            return False
+        last = self._explained_at.get(fp)
+        if last is not None and monotonic() - last < self.explain_every:
+            return False
+        return random.random() < self.explain_sample
+
+    async def _explain(self, fp: str, statement: str, parameters: Sequence):
+        try:
+            async with self.engine.connect() as raw:
+                conn = await raw.execution_options(**{SKIP_OPTION: True})
+                result = await conn.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}",
+                    tuple(parameters),
+                )
+                plan = result.scalar_one()
+            if isinstance(plan, str):
+                # asyncpg returns json columns as text
+                plan = json.loads(plan)
+            # the latest one, returned with the entry by /api/admin/slowQueries
+            self.fingerprints[fp]["plan"] = plan
+            logger.bind(
+                kind="slow_query_plan",
+                fingerprint=fp,
+                engine=self.name,
+                plan=plan,
+            ).info(
+                "[+] Plan captured for slow query {} on {}: {};",
+                fp,
+                self.name,
+                json.dumps(plan, ensure_ascii=False),
+            )
+        except Exception as e:
+            logger.warning("[-] EXPLAIN for slow query {} failed: {!r}", fp, e)
+        finally:
+            self._explaining = False
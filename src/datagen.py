@@ -0,0 +1,274 @@
+"""Synthetic dataset generator, loads through COPY.
+
+    cd src && PGHOST=localhost python datagen.py --orgs 1000000 --seed 42
+
+Drops and recreates every table. The same --orgs/--seed always produce the
+same rows, whatever --workers is: each chunk draws from its own RNG.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import asyncpg
+from loguru import logger
+
+from config import Config
+from database.dao import Database
+from database.orm import Base
+from database.settings import DatabaseSettings
+from test_data import create_schema
+from utils.transliteration import to_ltree_label
+
+TAXONOMY: Dict[str, Dict[str, List[str]]] = {
+    "Еда": {
+        "Молочная продукция": ["Сыры", "Йогурты", "Молоко"],
+        "Мясная продукция": ["Колбасы", "Полуфабрикаты", "Фермерское мясо"],
+        "Кондитерские изделия": ["Торты", "Шоколад", "Выпечка"],
+        "Общественное питание": ["Кафе", "Рестораны", "Столовые"],
+    },
+    "Автомобили": {
+        "Грузовые": ["Запчасти", "Шины", "Сервис"],
+        "Легковые": ["Запчасти", "Аксессуары", "Автомойки"],
+        "Продажа": ["Новые", "С пробегом"],
+    },
+    "Медицина": {
+        "Поликлиника": ["Детская", "Взрослая", "Стоматология"],
+        "Больница": ["Стационар", "Хирургия", "Родильный дом"],
+        "Аптеки": ["Лекарства", "Оптика", "Медтехника"],
+    },
+    "Образование": {
+        "Среднее образование": ["Гимназии", "Лицеи", "Школы"],
+        "Высшее образование": ["Университеты", "Институты"],
+        "Дополнительное образование": ["Языковые курсы", "Музыкальные школы"],
+    },
+    "Строительство": {
+        "Материалы": ["Кирпич", "Бетон", "Пиломатериалы"],
+        "Ремонт": ["Отделка", "Сантехника", "Электрика"],
+    },
+    "Спорт": {
+        "Фитнес": ["Тренажёрные залы", "Йога", "Бассейны"],
+        "Спорттовары": ["Одежда", "Инвентарь", "Велосипеды"],
+    },
+    "Финансы": {
+        "Банки": ["Вклады", "Кредиты", "Обмен валют"],
+        "Страхование": ["ОСАГО", "Здоровье", "Имущество"],
+    },
+    "Красота": {
+        "Салоны": ["Парикмахерские", "Маникюр", "Косметология"],
+        "Косметика": ["Уход", "Парфюмерия"],
+    },
+}
+
+# (name, lat, lon, weight): buildings cluster around cities, big ones denser
+CITIES = [
+    ("Москва", 55.7558, 37.6173, 12),
+    ("Санкт-Петербург", 59.9343, 30.3351, 6),
+    ("Новосибирск", 55.0084, 82.9357, 2),
+    ("Екатеринбург", 56.8389, 60.6057, 2),
+    ("Казань", 55.7961, 49.1064, 2),
+    ("Нижний Новгород", 56.2965, 43.9361, 2),
+    ("Самара", 53.1959, 50.1002, 1),
+    ("Ростов-на-Дону", 47.2357, 39.7015, 1),
+    ("Краснодар", 45.0355, 38.9753, 1),
+    ("Томск", 56.4847, 84.9482, 1),
+]
+STREETS = [
+    "ул. Ленина",
+    "ул. Пушкина",
+    "пр. Мира",
+    "ул. Гагарина",
+    "ул. Советская",
+    "ул. Садовая",
+    "наб. Речная",
+    "ул. Школьная",
+    "пер. Тихий",
+    "ш. Промышленное",
+]
+FORMS = ["ООО", "АО", "ИП", "ПАО", "ЗАО"]
+STEMS = ["Север", "Вектор", "Альфа", "Гарант", "Мир", "Лидер", "Росток", "Сфера"]
+ENDINGS = ["торг", "сервис", "строй", "мед", "групп", "плюс", "инвест", "лайн"]
+
+SECOND_BRANCH = 0.2  # share of orgs with an activity from a second branch
+
+SEQUENCES = {
+    "activities": "activities_id_seq",
+    "buildings": "buildings_id_seq",
+    "organizations": "organizations_id_seq",
+}
+
+
+def taxonomy_rows() -> List[Tuple[int, str, str, int]]:
+    # (id, label, ltree path, root index); ids in a fixed order
+    rows = []
+    for root_index, (root, children) in enumerate(TAXONOMY.items()):
+        chains = [[root]]
+        for child, leaves in children.items():
+            chains.append([root, child])
+            chains.extend([root, child, leaf] for leaf in leaves)
+        for chain in chains:
+            path = ".".join(map(to_ltree_label, chain))
+            rows.append((len(rows) + 1, chain[-1], path, root_index))
+    return rows
+
+
+def _rng(seed: int, table: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{table}:{chunk}")
+
+
+def building_chunk(seed: int, chunk: int, start: int, count: int) -> List[tuple]:
+    rng = _rng(seed, "buildings", chunk)
+    weights = [city[3] for city in CITIES]
+    rows = []
+    for b_id in range(start, start + count):
+        city, lat, lon, _ = rng.choices(CITIES, weights)[0]
+        rows.append(
+            (
+                b_id,
+                (
+                    f"г. {city}, {rng.choice(STREETS)}, д. {rng.randint(1, 200)},"
+                    f" корп. {b_id}"
+                ),
+                round(rng.gauss(lat, 0.08), 6),
+                round(rng.gauss(lon, 0.12), 6),
+            ),
+        )
+    return rows
+
+
+def org_chunk(
+    seed: int,
+    chunk: int,
+    start: int,
+    count: int,
+    buildings: int,
+) -> Tuple[List[tuple], List[tuple]]:
+    rng = _rng(seed, "organizations", chunk)
+    by_root: Dict[int, List[int]] = {}
+    for act_id, _, _, root in taxonomy_rows():
+        by_root.setdefault(root, []).append(act_id)
+
+    orgs, rels = [], []
+    for org_id in range(start, start + count):
+        title = (
+            f"{rng.choice(FORMS)} «{rng.choice(STEMS)}{rng.choice(ENDINGS)}» №{org_id}"
+        )
+        phones = [f"7{rng.randrange(10**9, 10**10)}" for _ in range(rng.randint(1, 3))]
+        orgs.append((org_id, title, json.dumps(phones), rng.randint(1, buildings)))
+
+        # mostly within one branch, sometimes a second one
+        acts = set(rng.sample(by_root[rng.randrange(len(by_root))], rng.randint(1, 3)))
+        if rng.random() < SECOND_BRANCH:
+            acts.add(rng.choice(by_root[rng.randrange(len(by_root))]))
+        rels.extend((org_id, act_id) for act_id in sorted(acts))
+    return orgs, rels
+
+
+def _secondary_indexes():
+    return [
+        index
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+        if not index.unique
+    ]
+
+
+async def _load(pool, executor, make, args: tuple, tables: List[Tuple[str, list]]):
+    # rows are built in a worker process, COPY runs on a pool connection
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(executor, make, *args)
+    if len(tables) == 1:
+        rows = (rows,)
+
+    async with pool.acquire() as conn:
+        for (table, columns), records in zip(tables, rows, strict=True):
+            await conn.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def generate(orgs: int, seed: int = 42, workers: int = 4, chunk: int = 50_000):
+    buildings = max(1, orgs // 5)
+    started = perf_counter()
+
+    await create_schema()
+    # building secondary indexes once after the load beats updating them per row
+    async with Database._engine.begin() as conn:
+        for index in _secondary_indexes():
+            await conn.run_sync(index.drop)
+
+    pool = await asyncpg.create_pool(Config.DB_URL_SYNC, min_size=1, max_size=workers)
+    try:
+        await pool.executemany(
+            "INSERT INTO activities (id, label, path) VALUES ($1, $2, $3::text::ltree)",
+            [row[:3] for row in taxonomy_rows()],
+        )
+
+        with ProcessPoolExecutor(workers) as executor:
+            await asyncio.gather(
+                *(
+                    _load(
+                        pool,
+                        executor,
+                        building_chunk,
+                        (seed, i, start, min(chunk, buildings - start + 1)),
+                        [("buildings", ["id", "addr", "lat", "lon"])],
+                    )
+                    for i, start in enumerate(range(1, buildings + 1, chunk))
+                ),
+            )
+            log_step("buildings", buildings, started)
+
+            await asyncio.gather(
+                *(
+                    _load(
+                        pool,
+                        executor,
+                        org_chunk,
+                        (seed, i, start, min(chunk, orgs - start + 1), buildings),
+                        [
+                            ("organizations", ["id", "title", "phone", "b_id"]),
+                            ("rel_ao", ["org_id", "act_id"]),
+                        ],
+                    )
+                    for i, start in enumerate(range(1, orgs + 1, chunk))
+                ),
+            )
+            log_step("organizations", orgs, started)
+
+        for table, sequence in SEQUENCES.items():
+            await pool.execute(
+                f"SELECT setval('{sequence}', (SELECT max(id) FROM {table}))",
+            )
+    finally:
+        await pool.close()
+
+    async with Database._engine.begin() as conn:
+        for index in _secondary_indexes():
+            await conn.run_sync(index.create)
+        for table in ("activities", "buildings", "organizations", "rel_ao"):
+            await conn.exec_driver_sql(f"ANALYZE {table}")
+    log_step("indexes", orgs, started)
+
+
+def log_step(step: str, rows: int, started: float):
+    logger.info("[+] {}: {} rows, {:.1f}s;", step, rows, perf_counter() - started)
+
+
+async def main(args):
+    await Database.init(Config.DB_URL, DatabaseSettings(pool_size=Config.DB_MAXCON))
+    try:
+        await generate(args.orgs, args.seed, args.workers, args.chunk)
+    finally:
+        await Database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orgs", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=50_000, help="rows per COPY")
+    asyncio.run(main(parser.parse_args()))
@@ -2,20 +2,38 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from pydantic import ValidationError
 
 from api.api_cu import router as CreateUpdateRouter
 from api.api_rd import router as ReadDeleteRouter
 from config import Config
+from database.cache import TTLCache
 from database.dao import Database
-from test_data import create_test_data
+from database.replicas import ReadAfterMiddleware
+from database.settings import DatabaseSettings
+from test_data import create_schema, create_test_data
+from utils.fieldsets import InvalidFieldsetError
+from utils.metrics import REGISTRY, MetricsMiddleware
+from utils.pagination import InvalidCursorError
+from utils.query_stats import QueryBudgetExceededError, QueryStatsMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await Database.init(Config.DB_URL, Config.DB_MAXCON)
-    await create_test_data()
+    cache = TTLCache(Config.CACHE_SIZE, Config.CACHE_TTL) if Config.CACHE_SIZE else None
+    await Database.init(
+        Config.DB_URL,
+        DatabaseSettings.from_config(Config),
+        cache=cache,
+        listen=Config.CACHE_NOTIFY,
+    )
+    if Config.SEED_TEST_DATA:
+        await create_test_data()
+    else:
+        await create_schema(drop=False)
+    await Database.load_activity_tree()
+    await Database.warm_up()
 
     yield
 
@@ -30,6 +48,9 @@ app = FastAPI(
 
 app.include_router(ReadDeleteRouter)
 app.include_router(CreateUpdateRouter)
+app.add_middleware(ReadAfterMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.exception_handler(ValidationError)
@@ -37,6 +58,24 @@ async def validation_exception_handler(request, exc: ValidationError):
     return JSONResponse(status_code=422, content={"error": str(exc)})
 
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"error": "Неверный курсор"})
+
+
+@app.exception_handler(InvalidFieldsetError)
+async def invalid_fieldset_handler(request, exc: InvalidFieldsetError):
+    return JSONResponse(status_code=400, content={"error": f"Неизвестные поля: {exc}"})
+
+
+@app.exception_handler(QueryBudgetExceededError)
+async def query_budget_handler(request, exc: QueryBudgetExceededError):
+    return JSONResponse(
+        status_code=500,
+        content={"error": f"Превышен бюджет запросов к БД: {exc}"},
+    )
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
     return JSONResponse(status_code=400, content={"error": str(exc)})
@@ -45,3 +84,11 @@ async def http_exception_handler(request, exc: HTTPException):
 @app.get("/")
 async def root():
     return RedirectResponse("/docs")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,7 +1,10 @@
-from sqlalchemy import text
+import asyncio
+
+from sqlalchemy import func, inspect, select, text
 from sqlalchemy_utils import Ltree
 
 from database.dao import Database
+from database.migrations import SCHEMA_LOCK, stamp_head, upgrade_head
 from database.orm import ActORM, Base, BuildORM, OrgORM, RelationshipAO
 from utils.transliteration import translit_table
 
@@ -9,12 +12,39 @@ from utils.transliteration import translit_table
 # volume for Postgres
 
 
-async def create_test_data():
-    async with Database._engine.begin() as conn:
-        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS ltree;"))
+async def create_schema(drop: bool = True):
+    # An empty database gets the tables from the models and is stamped at the
+    # latest migration; an existing one (e.g. left by an older release, which
+    # create_all would not touch) is upgraded by alembic. Workers take turns.
+    async with Database._engine.connect() as lock:
+        await lock.execute(select(func.pg_advisory_lock(SCHEMA_LOCK)))
+        await lock.commit()
+        try:
+            async with Database._engine.begin() as conn:
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS ltree;"))
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis;"))
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
 
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
+                if drop:
+                    await conn.run_sync(Base.metadata.drop_all)
+                fresh = not await conn.run_sync(
+                    lambda sync: inspect(sync).has_table(OrgORM.__tablename__),
+                )
+                if fresh:
+                    await conn.run_sync(Base.metadata.create_all)
+
+            # the database Database runs against, not necessarily Config's
+            await asyncio.to_thread(
+                stamp_head if fresh else upgrade_head,
+                Database._engine.url,
+            )
+        finally:
+            await lock.execute(select(func.pg_advisory_unlock(SCHEMA_LOCK)))
+            await lock.commit()
+
+
+async def create_test_data():
+    await create_schema()
 
     async with Database._sessionmaker() as session:
         builds = [
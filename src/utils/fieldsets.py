@@ -0,0 +1,40 @@
+from typing import NamedTuple
+
+# Organization fields a client may leave out (id is always returned) and
+# relations it may skip loading; omitted parameters mean everything.
+ORG_FIELDS = ("title", "phone")
+ORG_RELATIONS = ("building", "activities")
+
+
+class InvalidFieldsetError(ValueError):
+    pass
+
+
+class Fieldset(NamedTuple):
+    # hashable, so it can be part of read cache and coalescing keys
+    fields: frozenset = frozenset(ORG_FIELDS)
+    expand: frozenset = frozenset(ORG_RELATIONS)
+
+    def includes(self, name: str) -> bool:
+        return name == "id" or name in self.fields or name in self.expand
+
+
+FULL = Fieldset()
+
+
+def _names(value: str | None, allowed: tuple, default: frozenset) -> frozenset:
+    if value is None:
+        return default
+
+    names = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = names - set(allowed)
+    if unknown:
+        raise InvalidFieldsetError(", ".join(sorted(unknown)))
+    return names
+
+
+def parse_fieldset(fields: str | None, expand: str | None) -> Fieldset:
+    return Fieldset(
+        _names(fields, (*ORG_FIELDS, "id"), FULL.fields) - {"id"},
+        _names(expand, ORG_RELATIONS, FULL.expand),
+    )
@@ -0,0 +1,6 @@
+from typing import NamedTuple
+
+
+class GeoPoint(NamedTuple):
+    lat: float
+    lon: float
@@ -0,0 +1,237 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Prometheus text exposition without prometheus_client; per process, so with
+# several uvicorn workers each one reports its own numbers.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(str(value))}"'
+        for name, value in zip(names, values, strict=True)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def samples(self) -> List[str]: ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str):
+        super().__init__(name, doc)
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        # read at scrape time, e.g. pool counters owned by SQLAlchemy
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.get())}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS,
+    ):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        # per label set: per-bucket (non-cumulative) counts + overflow, sum
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts, total = self.values.setdefault(
+            labels,
+            ([0] * (len(self.buckets) + 1), [0.0]),
+        )
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                le = bound if isinstance(bound, str) else _number(bound)
+                labels = _labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total[0]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.header()
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route template and status",
+        ("method", "route", "status"),
+    ),
+)
+HTTP_DURATION = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template",
+        ("method", "route"),
+    ),
+)
+DAO_DURATION = REGISTRY.register(
+    Histogram(
+        "dao_call_duration_seconds",
+        "Database method latency, pool wait included",
+        ("method",),
+    ),
+)
+DAO_INFLIGHT = REGISTRY.register(
+    Gauge("dao_calls_in_flight", "Database method calls currently running"),
+)
+POOL_CHECKEDOUT = REGISTRY.register(
+    Gauge("db_pool_checkedout", "Connections checked out of the pool"),
+)
+POOL_OVERFLOW = REGISTRY.register(
+    Gauge("db_pool_overflow", "Connections open beyond pool_size"),
+)
+POOL_WAITERS = REGISTRY.register(
+    Gauge(
+        "db_pool_waiters",
+        "Estimated callers waiting for a connection"
+        " (in flight - checked out of the primary and replica pools)",
+    ),
+)
+
+# a Database method slow in dao_call_duration_seconds while db_pool_waiters
+# is high is starved for connections rather than running slow SQL
+
+
+_inside = ContextVar("inside_timed_call", default=False)
+
+
+def timed(func):
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        # a method calling another timed method is still one caller of the pool
+        outer = not _inside.get()
+        if outer:
+            DAO_INFLIGHT.inc()
+            token = _inside.set(True)
+        started = perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DAO_DURATION.observe(perf_counter() - started, name)
+            if outer:
+                _inside.reset(token)
+                DAO_INFLIGHT.dec()
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    # plain ASGI, so streamed bodies are not buffered; labelled by the route
+    # template FastAPI puts in the scope, never by the raw path
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            HTTP_REQUESTS.inc(scope["method"], template, str(status))
+            HTTP_DURATION.observe(perf_counter() - started, scope["method"], template)
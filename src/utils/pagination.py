@@ -0,0 +1,64 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, NamedTuple, Sequence
+
+from sqlalchemy import Select
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class PageParams(NamedTuple):
+    # hashable: part of the cache and coalescing keys of the reads taking it
+    limit: int
+    after: str | None = None
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, arity: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(cursor) from e
+
+    if not isinstance(key, list) or len(key) != arity:
+        raise InvalidCursorError(cursor)
+
+    return key
+
+
+@dataclass
+class Page[T]:
+    items: List[T] = field(default_factory=list)
+    cursor: str | None = None
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Sequence[T],
+        limit: int,
+        key: Callable[[T], Sequence[Any]],
+    ) -> "Page[T]":
+        # rows are fetched with limit + 1 to know whether a next page exists
+        items = list(rows[:limit])
+        cursor = encode_cursor(key(items[-1])) if len(rows) > limit else None
+        return cls(items=items, cursor=cursor)
+
+
+def keyset(stmt: Select, column, page: PageParams) -> Select:
+    if page.after is not None:
+        (last,) = decode_cursor(page.after, 1)
+        if not isinstance(last, int):
+            raise InvalidCursorError(page.after)
+        stmt = stmt.where(column > last)
+
+    return stmt.order_by(column).limit(page.limit + 1)
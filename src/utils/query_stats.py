@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Iterator
+
+from fastapi import Depends, Request
+from loguru import logger
+from sqlalchemy import event
+
+from config import Config
+
+
+class QueryBudgetExceededError(Exception):
+    def __init__(self, count: int, limit: int):
+        super().__init__(f"{count} statements, budget {limit}")
+        self.count = count
+        self.limit = limit
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Set per HTTP request; SQLAlchemy runs engine events in a greenlet that
+# inherits the caller's context, so they see the request's QueryStats.
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(_conn, _cursor, _statement, _params, context, _executemany):
+    context._query_started = perf_counter()
+
+
+def _after_cursor_execute(_conn, _cursor, _statement, _params, context, _executemany):
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += perf_counter() - context._query_started
+
+
+def instrument(engine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def query_budget(limit: int):
+    # Declared per route, checked after the handler: in DEV_MODE an overrun
+    # fails the request with 500, otherwise it is only logged. Cache hits and
+    # coalesced calls run fewer queries, never more.
+    async def check(request: Request):
+        yield
+        stats = _current.get()
+        if stats is None or stats.count <= limit:
+            return
+
+        if Config.DEV_MODE:
+            raise QueryBudgetExceededError(stats.count, limit)
+        logger.warning(
+            "[-] Query budget exceeded on {}: {} statements, budget {};",
+            request.url.path,
+            stats.count,
+            limit,
+        )
+
+    return Depends(check)
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # statements run after this (streamed bodies) are not reported
+                total = (perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"'
+                    f", app;dur={total:.2f}"
+                )
+                message.setdefault("headers", [])
+                message["headers"] = [
+                    *message["headers"],
+                    (b"server-timing", timing.encode()),
+                ]
+            await send(message)
+
+        with count_queries() as stats:
+            await self.app(scope, receive, send_wrapper)
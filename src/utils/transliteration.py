@@ -1,3 +1,5 @@
+import re
+
 rus_to_lat = {
     ord("А"): "A",
     ord("а"): "a",
@@ -68,3 +70,8 @@ rus_to_lat = {
 }
 
 translit_table = str.maketrans(rus_to_lat)
+
+
+def to_ltree_label(label: str) -> str:
+    # ltree labels allow only [A-Za-z0-9_]
+    return re.sub(r"\W", "_", label.translate(translit_table), flags=re.ASCII) or "_"
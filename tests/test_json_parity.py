@@ -0,0 +1,187 @@
+"""PG_JSON_READS parity: documents assembled by Postgres must parse to the same
+JSON as the ORM path, page by page, cursors included."""
+
+import json
+
+import pytest
+from sqlalchemy_utils import Ltree
+
+from api.responses import json_list_response, list_response, sparse_model
+from database.dao import org_tags
+from database.models import OrganizationOut
+from database.orm import ActORM, BuildORM, OrgORM, RelationshipAO
+from utils.fieldsets import FULL, parse_fieldset
+from utils.pagination import PageParams
+
+FIELDSETS = [
+    FULL,
+    parse_fieldset("title", ""),
+    parse_fieldset("phone", "building"),
+    parse_fieldset("id", "activities"),
+    parse_fieldset(None, ""),
+]
+
+# small pages, so every query below spans several of them
+LIMIT = 2
+
+SYDNEY = (-33.8688197, 151.2092955)
+
+
+@pytest.fixture(scope="module")
+def seeded(database, run):
+    async def seed():
+        async with database._sessionmaker() as session:
+            # integral floats (55.0 comes back from Postgres as 55), long
+            # fractions and negatives
+            builds = [
+                BuildORM(addr="ул. Целая, 1", lat=55.0, lon=37.0),
+                BuildORM(addr="пл. Красная, 1", lat=55.753930, lon=37.620795),
+                BuildORM(addr="George St, 1", lat=SYDNEY[0], lon=SYDNEY[1]),
+            ]
+            acts = [
+                ActORM(label="Еда", path=Ltree("Eda")),
+                ActORM(label="Мясная продукция", path=Ltree("Eda.Mjasnaja_produkcija")),
+                ActORM(label="Колбасы", path=Ltree("Eda.Mjasnaja_produkcija.Kolbasy")),
+                ActORM(label="Автомобили", path=Ltree("Avtomobili")),
+            ]
+            session.add_all(builds + acts)
+            await session.flush()
+
+            # (building, activities): one without activities, one with an
+            # empty phone list, several per building and per activity
+            specs = [
+                (0, []),
+                (0, [2, 3]),
+                (0, [0]),
+                (1, [1]),
+                (1, [1, 2]),
+                (1, [3]),
+                (1, []),
+                (2, [2]),
+            ]
+            orgs = [
+                OrgORM(
+                    title=f"Организация {i}",
+                    phone=[] if i == len(specs) - 1 else [f"7-900-000-00-0{i}"],
+                    b_id=builds[b].id,
+                )
+                for i, (b, _) in enumerate(specs)
+            ]
+            session.add_all(orgs)
+            await session.flush()
+
+            session.add_all(
+                RelationshipAO(org_id=org.id, act_id=acts[a].id)
+                for org, (_, act_indexes) in zip(orgs, specs, strict=True)
+                for a in act_indexes
+            )
+            await session.commit()
+            return [b.id for b in builds]
+
+    b_ids = run(seed())
+    run(database.load_activity_tree())
+    return b_ids
+
+
+async def _pages(read, as_json: bool, fieldset):
+    pages, after = [], None
+    while True:
+        page = await read(PageParams(LIMIT, after), as_json=as_json, fieldset=fieldset)
+        pages.append(page)
+        if page.cursor is None:
+            return pages
+        after = page.cursor
+
+
+def _orm_docs(page, fieldset) -> list:
+    body = list_response(sparse_model(OrganizationOut, fieldset), page.items).body
+    docs = json.loads(body)
+    # the ORM relationship has no ORDER BY, json_agg orders by id
+    for doc in docs:
+        if "activities" in doc:
+            doc["activities"].sort(key=lambda act: act["id"])
+    return docs
+
+
+def _json_docs(page) -> list:
+    return json.loads(json_list_response([doc.json for doc in page.items]).body)
+
+
+def _assert_parity(run, read, fieldset):
+    orm_pages = run(_pages(read, False, fieldset))
+    json_pages = run(_pages(read, True, fieldset))
+
+    assert [p.cursor for p in json_pages] == [p.cursor for p in orm_pages]
+    for orm_page, json_page in zip(orm_pages, json_pages, strict=True):
+        orm_docs, json_docs = _orm_docs(orm_page, fieldset), _json_docs(json_page)
+        assert json_docs == orm_docs
+
+
+@pytest.mark.parametrize("fieldset", FIELDSETS, ids=repr)
+@pytest.mark.parametrize("building", [0, 1, 2])
+def test_by_building_id(database, run, seeded, building, fieldset):
+    def read(page, **kwargs):
+        return database.get_organizations_by_bid(seeded[building], page, **kwargs)
+
+    _assert_parity(run, read, fieldset)
+
+
+@pytest.mark.parametrize("fieldset", FIELDSETS, ids=repr)
+@pytest.mark.parametrize(
+    "query",
+    [
+        ("Еда", False),
+        ("Еда", True),
+        ("Мясная продукция", False),
+        ("Колбасы", True),
+        ("Автомобили", False),
+        ("Нет такой", False),
+    ],
+)
+def test_by_activity(database, run, seeded, query, fieldset):
+    label, strict = query
+
+    def read(page, **kwargs):
+        return database.get_organizations_by_activity(
+            label,
+            page,
+            strict=strict,
+            **kwargs,
+        )
+
+    _assert_parity(run, read, fieldset)
+
+
+def test_empty_activities_and_floats(database, run, seeded):
+    # the cases the two paths are most likely to disagree on, spelled out
+    page = run(
+        database.get_organizations_by_bid(seeded[0], PageParams(10), as_json=True),
+    )
+    docs = {doc["title"]: doc for doc in _json_docs(page)}
+
+    assert docs["Организация 0"]["activities"] == []
+    assert docs["Организация 0"]["building"]["lat"] == pytest.approx(55.0)
+
+    page = run(
+        database.get_organizations_by_bid(seeded[2], PageParams(10), as_json=True),
+    )
+    (doc,) = _json_docs(page)
+    assert doc["phone"] == []
+    assert (doc["building"]["lat"], doc["building"]["lon"]) == SYDNEY
+
+
+def test_documents_tagged_with_building(database, run, seeded):
+    # deleting a building cascades to its organizations: documents without
+    # the building expanded must still be evicted by bld:<id>
+    page = run(
+        database.get_organizations_by_bid(
+            seeded[1],
+            PageParams(10),
+            as_json=True,
+            fieldset=parse_fieldset(None, ""),
+        ),
+    )
+    assert page.items
+    for doc in page.items:
+        assert "building" not in json.loads(doc.json)
+        assert f"bld:{seeded[1]}" in org_tags(doc)